@@ -1,7 +1,96 @@
+import json
+import time
 import streamlit as st
 import requests
 
 BACKEND_URL = "http://localhost:8000/processing/process-image/"
+BACKEND_BASE = "http://localhost:8000"
+POLL_INTERVAL = 2  # seconds between job status polls (fallback when the event stream is unavailable)
+STAGE_LABELS = {
+    "queued": "Queued",
+    "pages": "Reading pages",
+    "students": "Grading students",
+    "exports": "Writing exports",
+    "done": "Done",
+    "failed": "Failed",
+}
+
+
+def iter_sse(response):
+    """(event, data) pairs of a server-sent event stream."""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue  # keep-alive comment
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+
+def show_progress(bar, prog):
+    pages_total = prog.get("pages_total") or 0
+    fraction = 0.0
+    if prog.get("stage") == "done":
+        fraction = 1.0
+    elif prog.get("stage") == "exports":
+        fraction = 0.95
+    elif pages_total:
+        # pages are the bulk of the work; students are finished while pages stream in
+        fraction = 0.9 * min(1.0, (prog.get("pages_done") or 0) / pages_total)
+    bar.progress(fraction, text=(
+        f"{STAGE_LABELS.get(prog.get('stage'), prog.get('stage'))}: pages {prog.get('pages_done')}/{pages_total or '?'}, "
+        f"students {prog.get('students_done')}/{prog.get('students_total') or '?'}"
+    ))
+
+
+def follow_events(job, bar, students_box):
+    """
+    Live progress + per-student rows from the job event stream, until the job is done or failed.
+    Returns False if the stream ended without a final status event (job no longer known to the backend).
+    """
+    students = []
+    with requests.get(BACKEND_BASE + job["events_url"], stream=True, timeout=(10, 60)) as resp:
+        resp.raise_for_status()
+        for event, data in iter_sse(resp):
+            if event == "progress":
+                show_progress(bar, data)
+            elif event == "student_finalized":
+                students.append({
+                    "Student": data["student"],
+                    "Matriculation Number": data.get("matriculation_number"),
+                    "Seat Number": data.get("seat_number"),
+                    "Achieved": data.get("total"),
+                    "Max": data.get("max_total"),
+                    "Percent": data.get("percent"),
+                    "Mark": data.get("final_mark"),
+                    "Issues": len(data.get("issues") or []),
+                    "Low-confidence boxes": data.get("low_confidence_boxes", 0),
+                })
+                students_box.dataframe(students, use_container_width=True)
+            elif event == "status":
+                return True
+    return False
+
+
+def poll_until_finished(job, bar):
+    while True:
+        resp = requests.get(BACKEND_BASE + job["status_url"], timeout=30)
+        if resp.status_code == 404:
+            # job no longer known to the backend; the result request reports it
+            return
+        status = resp.json()
+        show_progress(bar, status.get("progress", {}))
+        if status.get("status") in ("done", "failed"):
+            return
+        time.sleep(POLL_INTERVAL)
+
 
 st.set_page_config(page_title="Exam Evaluation", layout="centered")
 st.title("📄 Exam Evaluation System")
@@ -12,16 +101,37 @@ if uploaded_file:
     st.success(f"Uploaded file: {uploaded_file.name}")
 
     if st.button("Process File"):
-        with st.spinner("Processing..."):
-            files = {"file": (uploaded_file.name, uploaded_file, "application/pdf")}
-            try:
-                response = requests.post(BACKEND_URL, files=files)
-                if response.status_code == 200:
-                    result = response.json()
-                    st.success(f"✅ {result.get('message', 'Files processed successfully!')}")
+        files = {"file": (uploaded_file.name, uploaded_file, "application/pdf")}
+        try:
+            response = requests.post(BACKEND_URL, files=files, timeout=300)
+            if response.status_code in (200, 202):
+                job = response.json()
+                bar = st.progress(0.0, text=STAGE_LABELS["queued"])
+                students_box = st.empty()
+
+                try:
+                    finished = follow_events(job, bar, students_box)
+                except requests.RequestException:
+                    finished = False
+                if not finished:
+                    # stream unavailable (proxy, timeout) or closed early: fall back to polling the job status
+                    poll_until_finished(job, bar)
 
+                result_resp = requests.get(BACKEND_BASE + job["result_url"], timeout=30)
+                if result_resp.status_code == 200:
+                    result = result_resp.json()
+                    bar.progress(1.0, text=STAGE_LABELS["done"])
+                    st.success(f"✅ {result.get('message', 'Files processed successfully!')}")
+                    skipped = (result.get("low_confidence_boxes") or {}).get("total", 0)
+                    if skipped:
+                        st.warning(f"{skipped} low-confidence detections were not read (see the per-student list in the result).")
+                    if result.get("zip_if_batch"):
+                        # the bundle is streamed by the backend; the browser downloads it directly
+                        st.markdown(f"[⬇️ Download all results (ZIP)]({BACKEND_BASE + result['zip_if_batch']})")
                 else:
-                    st.error(f"❌ Error {response.status_code}: {response.text}")
-            except Exception as e:
-                st.error(f"⚠️ Failed to connect to backend: {e}")
+                    st.error(f"❌ Error {result_resp.status_code}: {result_resp.text}")
 
+            else:
+                st.error(f"❌ Error {response.status_code}: {response.text}")
+        except Exception as e:
+            st.error(f"⚠️ Failed to connect to backend: {e}")
@@ -0,0 +1,278 @@
+"""
+Stage benchmarks on synthetic exam PDFs (see benchmarks/synthetic_exam.py).
+
+    python -m benchmarks.run_benchmarks --students 20 --pages 4 --out benchmarks/results/run.json
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/old.json benchmarks/results/run.json
+
+Stages: render, detection, ocr, extraction, grade_assignment, excel_student, excel_combined, bundle. Each reports item
+throughput and per-call latency percentiles; the Metrics breakdown of the run (model_predict,
+crop_preprocess, jpeg_save, recognition, digit_recognition, excel_write, primus_write, zip, ...) is stored next to them.
+Detection uses the colour-frame stub unless --detector yolo; OCR uses docTR when it is installed
+(--recognizer auto) and a constant stub otherwise, which is recorded in the result.
+grade_assignment runs StudentUtils.assign_grades_to_questions on one large synthetic input
+(--assign-questions questions, 3 grades each) instead of the small per-student groups.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# read by functions.config on import: results must not come from the page cache
+os.environ.setdefault("EXAM_PAGE_CACHE", "0")
+
+import pypdfium2 as pdfium
+
+from benchmarks.stubs import ColorFrameDetector, ConstantRecognizer
+from benchmarks.synthetic_exam import SyntheticExam, assignment_inputs, german_number, page_results
+from functions import ocr
+from functions.config import DETECT_SCALE, DIGIT_OCR, RENDER_SCALE, YOLO_BATCH_SIZE, IN_MEMORY_PIPELINE
+from functions.matnum_utils import MatNumUtils
+from functions.metrics_utils import Metrics
+from functions.model_registry import ModelRegistry
+from functions.pipeline_utils import PipelineUtils
+from functions.state_utils import StateUtils
+from functions.student_utils import StudentUtils
+from functions.yolo_detection import process_images_with_yolo_batch
+from functions.zip_utils import ZipUtils
+
+SCHEMA_VERSION = 1
+STAGE_UNITS = {
+    "render": "pages",
+    "detection": "pages",
+    "ocr": "crops",
+    "extraction": "pages",
+    "grade_assignment": "grades",
+    "excel_student": "students",
+    "excel_combined": "students",
+    "bundle": "bytes",
+}
+
+
+class StageStats:
+    def __init__(self, unit: str):
+        self.unit = unit
+        self.latencies: List[float] = []
+        self.items = 0
+
+    @contextmanager
+    def timed(self, items: int = 1) -> Iterator[None]:
+        t0 = time.perf_counter()
+        yield
+        self.latencies.append(time.perf_counter() - t0)
+        self.items += items
+
+    def summary(self) -> Dict[str, Any]:
+        lat = sorted(self.latencies)
+        total = sum(lat)
+
+        def pct(q: float) -> Optional[float]:
+            # nearest rank
+            return round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 3) if lat else None
+
+        return {
+            "unit": self.unit,
+            "calls": len(lat),
+            "items": self.items,
+            "total_seconds": round(total, 4),
+            "throughput_per_s": round(self.items / total, 3) if total > 0 else None,
+            "latency_ms": {"mean": round(total / len(lat) * 1000, 3) if lat else None,
+                           "p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0)},
+        }
+
+
+def _git_revision() -> Dict[str, Any]:
+    root = Path(__file__).resolve().parent.parent
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                                    capture_output=True, text=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def _install_models(detector: str, recognizer: str) -> Dict[str, str]:
+    if detector == "stub":
+        ModelRegistry.use("detector", ColorFrameDetector())
+    if recognizer == "auto":
+        try:
+            import doctr  # noqa: F401
+            recognizer = "doctr"
+        except ImportError:
+            recognizer = "stub"
+    if recognizer == "stub":
+        ModelRegistry.use("recognizer", ConstantRecognizer())
+        ModelRegistry.use("digit_recognizer", ConstantRecognizer())
+    # load the real models now so their load time is not part of the first batch
+    ModelRegistry.warm_up()
+    return {"detector": detector, "recognizer": recognizer}
+
+
+def run(students: int, pages: int, questions: int, seed: int, detector: str, recognizer: str,
+        workdir: Path, assign_questions: int = 0) -> Dict[str, Any]:
+    stats = {name: StageStats(unit) for name, unit in STAGE_UNITS.items()}
+    models = _install_models(detector, recognizer)
+
+    t0 = time.perf_counter()
+    truth = SyntheticExam(students, pages, questions, seed).generate(workdir / "exam.pdf")
+    generate_seconds = time.perf_counter() - t0
+    pdf_folder = workdir / "pipeline"
+    out_folder = workdir / "results"
+    run_id = f"bench-{seed}"
+
+    with Metrics.job() as metrics:
+        # render + detection + OCR, batched like process_page_range
+        pdf = pdfium.PdfDocument(truth["pdf"])
+        cache_params = PipelineUtils._cache_params()
+        expected = detected = blank = 0
+        try:
+            n_pages = len(pdf)
+            for start in range(0, n_pages, max(1, YOLO_BATCH_SIZE)):
+                batch = []
+                for i in range(start, min(start + YOLO_BATCH_SIZE, n_pages)):
+                    with stats["render"].timed():
+                        rendered = PipelineUtils._render_page(pdf, i, pdf_folder, cache_params)
+                    if rendered["blank"]:
+                        blank += 1
+                    else:
+                        batch.append(rendered)
+                if not batch:
+                    continue
+
+                regions = [PipelineUtils._region_renderer(pdf, r["page"] - 1) for r in batch] if DETECT_SCALE > 0 else None
+                with stats["detection"].timed(len(batch)):
+                    yolo_results = process_images_with_yolo_batch(
+                        [r["image"] for r in batch], [r["page_folder"] for r in batch],
+                        image_paths=[r["image_path"] for r in batch], in_memory=IN_MEMORY_PIPELINE, regions=regions)
+
+                n_crops = sum(len(yr["cropped_images"]) for yr in yolo_results)
+                with stats["ocr"].timed(n_crops):
+                    ocr._ocr_yolo_results(yolo_results)
+
+                expected += sum(len(truth["pages"][r["page"] - 1]["fields"]) for r in batch)
+                detected += n_crops
+        finally:
+            pdf.close()
+
+        # extraction + exports on the ground truth (what a perfect detector + recognizer would give)
+        gt_pages = page_results(truth, RENDER_SCALE)
+        graded_students, folders = [], []
+        mismatches = 0
+        for idx, group in enumerate(MatNumUtils.split_pages_by_matnum(gt_pages)):
+            with stats["extraction"].timed(len(group)):
+                student_info, qmap, per_q_seen, page_markers = StudentUtils.extract_from_pages(group)
+            expected_q = truth["students"][idx]["questions"] if idx < len(truth["students"]) else {}
+            mismatches += sum(1 for q, e in expected_q.items()
+                              if (qmap.get(q) or {}).get("raw") != german_number(e["achieved"]))
+
+            student = StateUtils.student_state(student_info, qmap, per_q_seen, page_markers, group)
+            folder = out_folder / f"student_{idx + 1}"
+            folder.mkdir(parents=True, exist_ok=True)
+            graded = PipelineUtils.grade_student(student, out_folder)
+            with stats["excel_student"].timed():
+                PipelineUtils.write_student_excel(graded, folder, run_id)
+            graded_students.append(graded)
+            folders.append(folder)
+
+        if assign_questions > 0:
+            qs, grades = assignment_inputs(assign_questions, seed=seed)
+            for _ in range(5):
+                with stats["grade_assignment"].timed(len(grades)):
+                    StudentUtils.assign_grades_to_questions(qs, grades)
+
+        with stats["excel_combined"].timed(len(graded_students)):
+            PipelineUtils.write_batch_outputs(graded_students, folders, out_folder, run_id)
+
+        members = PipelineUtils.bundle_members(out_folder)
+        if members:
+            size = 0
+            with stats["bundle"].timed(0):
+                for chunk in ZipUtils.stream(members):
+                    size += len(chunk)
+            stats["bundle"].items += size
+
+    return {
+        "schema": SCHEMA_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **_git_revision(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        "config": {"students": students, "pages_per_student": pages, "questions_per_page": questions,
+                   "seed": seed, "assign_questions": assign_questions, **models, "render_scale": RENDER_SCALE, "detect_scale": DETECT_SCALE,
+                   "yolo_batch_size": YOLO_BATCH_SIZE, "in_memory": IN_MEMORY_PIPELINE, "digit_ocr": DIGIT_OCR},
+        "generate_seconds": round(generate_seconds, 3),
+        "checks": {"expected_boxes": expected, "detected_boxes": detected, "blank_pages": blank,
+                   "extraction_mismatches": mismatches},
+        "stages": {name: s.summary() for name, s in stats.items() if s.latencies},
+        "metrics": metrics.snapshot()["stages"],
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """One line per stage (throughput change); lines of stages slower than threshold start with "REGRESSION"."""
+    lines = [f"baseline {str(baseline.get('commit'))[:12]} -> current {str(current.get('commit'))[:12]}"]
+    if baseline.get("config") != current.get("config"):
+        lines.append("warning: the runs used different configurations")
+    for name, cur in current.get("stages", {}).items():
+        base = baseline.get("stages", {}).get(name)
+        if not base or not base.get("throughput_per_s") or not cur.get("throughput_per_s"):
+            continue
+        change = cur["throughput_per_s"] / base["throughput_per_s"] - 1
+        tag = "REGRESSION" if change < -threshold else "ok"
+        lines.append(f"{tag:<10} {name:<15} {base['throughput_per_s']:>12} -> {cur['throughput_per_s']:>12} "
+                     f"{cur['unit']}/s ({change:+.1%})")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the exam pipeline stages on synthetic PDFs.")
+    parser.add_argument("--students", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=4, help="pages per student")
+    parser.add_argument("--questions", type=int, default=2, help="questions per page")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--assign-questions", type=int, default=2000,
+                        help="questions in the grade_assignment input (0 skips the stage)")
+    parser.add_argument("--detector", choices=["stub", "yolo"], default="stub")
+    parser.add_argument("--recognizer", choices=["auto", "stub", "doctr"], default="auto")
+    parser.add_argument("--workdir", type=Path, help="keep the generated files here (default: temporary)")
+    parser.add_argument("--out", type=Path, help="write the JSON result here (default: stdout)")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("BASELINE", "CURRENT"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.1, help="throughput drop reported as regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        baseline, current = (json.loads(p.read_text(encoding="utf-8")) for p in args.compare)
+        lines = compare(baseline, current, args.threshold)
+        print("\n".join(lines))
+        return 1 if any(line.startswith("REGRESSION") for line in lines) else 0
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="exam_bench_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    try:
+        result = run(args.students, args.pages, args.questions, args.seed, args.detector, args.recognizer, workdir,
+                     args.assign_questions)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
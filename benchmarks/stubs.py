@@ -0,0 +1,73 @@
+from typing import Any, List, Tuple, Union
+import cv2
+import numpy as np
+
+from benchmarks.synthetic_exam import LABEL_COLORS
+
+# OpenCV hue (0-179) of each frame colour
+_LABEL_HUES = {
+    label: int(cv2.cvtColor(np.uint8([[rgb[::-1]]]), cv2.COLOR_BGR2HSV)[0, 0, 0])
+    for label, rgb in LABEL_COLORS.items()
+}
+
+
+class _Boxes:
+    def __init__(self, xyxy: np.ndarray, cls: np.ndarray):
+        self.xyxy = xyxy
+        self.cls = cls
+        self.conf = np.ones(len(cls), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.cls)
+
+
+class _Result:
+    def __init__(self, boxes: _Boxes):
+        self.boxes = boxes
+
+
+class ColorFrameDetector:
+    """
+    Stand-in for the YOLO model on synthetic exams: finds the coloured field frames drawn by
+    SyntheticExam (saturation mask + hue per label + connected components). Same predict()
+    interface as ultralytics (results[i].boxes.xyxy / .cls / .conf, model.names), no weights needed;
+    every frame is found with confidence 1 and predict() arguments (conf, classes, ...) are ignored.
+    """
+
+    def __init__(self, hue_tolerance: int = 10, min_side: int = 8):
+        self.names = dict(enumerate(LABEL_COLORS))
+        self.hue_tolerance = hue_tolerance
+        self.min_side = min_side
+
+    def predict(self, source: Union[np.ndarray, List[np.ndarray]], **kwargs) -> List[_Result]:
+        images = [source] if isinstance(source, np.ndarray) else list(source)
+        return [self._detect(img) for img in images]
+
+    def _detect(self, img: np.ndarray) -> _Result:
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        hue = hsv[..., 0].astype(np.int16)
+        saturated = (hsv[..., 1] > 110) & (hsv[..., 2] > 70)
+        boxes, classes = [], []
+        for cls_id, label in self.names.items():
+            diff = np.abs(hue - _LABEL_HUES[label])
+            mask = saturated & (np.minimum(diff, 180 - diff) <= self.hue_tolerance)
+            n, _, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+            for x, y, w, h, _area in stats[1:n]:
+                if w >= self.min_side and h >= self.min_side:
+                    boxes.append([x, y, x + w, y + h])
+                    classes.append(cls_id)
+        # top-to-bottom like a real detector's output is not guaranteed either, but keeps runs comparable
+        order = sorted(range(len(boxes)), key=lambda i: (boxes[i][1], boxes[i][0]))
+        xyxy = np.array([boxes[i] for i in order], dtype=np.float32).reshape(-1, 4)
+        cls = np.array([classes[i] for i in order], dtype=np.float32)
+        return _Result(_Boxes(xyxy, cls))
+
+
+class ConstantRecognizer:
+    """Stand-in for the docTR recognition predictor: one fixed (text, confidence) per crop."""
+
+    def __init__(self, prediction: Tuple[str, float] = ("0", 1.0)):
+        self.prediction = prediction
+
+    def __call__(self, crops: List[Any]) -> List[Tuple[str, float]]:
+        return [self.prediction for _ in crops]
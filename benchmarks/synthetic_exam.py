@@ -0,0 +1,198 @@
+import random
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+from PIL import Image, ImageDraw, ImageFont
+
+from functions.detection_record import Detection
+from functions.pdf_utils import PdfUtils
+
+# A4 in PDF points, scanned at SCAN_DPI
+PAGE_SIZE_PT = (595.28, 841.89)
+SCAN_DPI = 200
+
+# Every detected field is framed in its own saturated colour (RGB); the stub detector finds the frames
+LABEL_COLORS = {
+    "question_num": (230, 0, 0),
+    "grades": (0, 0, 230),
+    "Mat_num": (0, 170, 0),
+    "seat_num": (220, 0, 220),
+    "page_number": (0, 190, 190),
+}
+FRAME_WIDTH = 6  # pixels at SCAN_DPI
+
+TOPICS = ["Lineare Algebra", "Analysis", "Wahrscheinlichkeit", "Statistik", "Numerik", "Graphentheorie",
+          "Logik", "Kombinatorik", "Optimierung", "Differentialgleichungen"]
+
+
+def _font(size: int) -> ImageFont.ImageFont:
+    # DejaVu ships with matplotlib (a requirement); PIL's bundled font is the fallback
+    try:
+        from matplotlib import font_manager
+        return ImageFont.truetype(font_manager.findfont("DejaVu Sans"), size)
+    except Exception:
+        return ImageFont.load_default(size=size)
+
+
+def _pt(value: float) -> int:
+    return int(round(value * SCAN_DPI / 72))
+
+
+def german_number(value: float) -> str:
+    return f"{value:g}".replace(".", ",")
+
+
+class SyntheticExam:
+    """
+    Scanned-looking exam PDFs with known content: per student a Mat_num and seat field on the first page,
+    "N. Frage <topic> (X Punkte)" headers, scribbled answers, handwritten-style grade boxes and
+    "Seite X von Y" footers. generate() returns the ground truth next to the PDF.
+    """
+
+    def __init__(self, students: int = 10, pages_per_student: int = 4, questions_per_page: int = 2, seed: int = 0):
+        if students < 1 or pages_per_student < 1 or questions_per_page < 1:
+            raise ValueError("students, pages_per_student and questions_per_page must be >= 1")
+        self.students = students
+        self.pages_per_student = pages_per_student
+        self.questions_per_page = questions_per_page
+        self.seed = seed
+        self.print_font = _font(34)
+        self.small_font = _font(28)
+        self.hand_font = _font(56)
+
+    def generate(self, out_pdf: Path) -> Dict[str, Any]:
+        """
+        Write the PDF and return {"pdf", "pages": [...], "students": [...]}.
+        Per page: {"page" (1-based), "student" (0-based), "fields": [{"label", "text", "bbox_pt"}]},
+        bbox_pt = [x1, y1, x2, y2] in PDF points from the top-left corner.
+        """
+        rng = random.Random(self.seed)
+        out_pdf = Path(out_pdf)
+        out_pdf.parent.mkdir(parents=True, exist_ok=True)
+        pages: List[Dict[str, Any]] = []
+        students: List[Dict[str, Any]] = []
+
+        with tempfile.TemporaryDirectory(prefix="synthetic_exam_") as tmp:
+            image_paths = []
+            for s in range(self.students):
+                student = {
+                    "Mat_num": str(rng.randint(1000000, 9999999)),
+                    "Seat_num": f"{rng.choice('ABCDEFGH')}{rng.randint(1, 40)}",
+                    "questions": {},
+                }
+                students.append(student)
+                qnum = 1
+                for p in range(self.pages_per_student):
+                    img = Image.new("RGB", (_pt(PAGE_SIZE_PT[0]), _pt(PAGE_SIZE_PT[1])), (250, 250, 247))
+                    draw = ImageDraw.Draw(img)
+                    fields: List[Dict[str, Any]] = []
+                    top = 60.0
+                    if p == 0:
+                        fields.append(self._field(img, draw, "Mat_num", f"Matrikelnummer: {student['Mat_num']}",
+                                                  (50, 40, 300, 80), rng, handwritten=True))
+                        fields.append(self._field(img, draw, "seat_num", f"Sitzplatz: {student['Seat_num']}",
+                                                  (360, 40, 545, 80), rng, handwritten=True))
+                        top = 110.0
+
+                    block = (780.0 - top) / self.questions_per_page
+                    for q in range(self.questions_per_page):
+                        y = top + q * block
+                        max_marks = rng.randint(4, 20)
+                        achieved = rng.randint(0, max_marks * 2) / 2
+                        student["questions"][str(qnum)] = {"max_marks": max_marks, "achieved": achieved}
+                        fields.append(self._field(img, draw, "question_num",
+                                                  f"{qnum}. Frage {rng.choice(TOPICS)} ({max_marks} Punkte)",
+                                                  (50, y, 420, y + 32), rng))
+                        self._scribble(draw, (60, y + 45, 430, y + block - 30), rng)
+                        gy = y + block - 75
+                        fields.append(self._field(img, draw, "grades", german_number(achieved),
+                                                  (460, gy, 545, gy + 50), rng, handwritten=True))
+                        qnum += 1
+
+                    fields.append(self._field(img, draw, "page_number", f"Seite {p + 1} von {self.pages_per_student}",
+                                              (230, 795, 365, 825), rng))
+                    path = Path(tmp) / f"page_{len(pages) + 1:05d}.jpg"
+                    img.save(path, quality=90, subsampling=0)  # 4:4:4 keeps the thin colour frames crisp
+                    image_paths.append(path)
+                    pages.append({"page": len(pages) + 1, "student": s, "fields": fields})
+
+            PdfUtils.write_jpeg_pdf(image_paths, out_pdf, dpi=SCAN_DPI)
+
+        return {"pdf": str(out_pdf), "pages": pages, "students": students}
+
+    def _field(self, img: Image.Image, draw: ImageDraw.ImageDraw, label: str, text: str,
+               box: Tuple[float, float, float, float], rng: random.Random, handwritten: bool = False) -> Dict[str, Any]:
+        x1, y1, x2, y2 = box
+        draw.rectangle([_pt(x1), _pt(y1), _pt(x2), _pt(y2)], outline=LABEL_COLORS[label], width=FRAME_WIDTH)
+        inner = (_pt(x1) + 2 * FRAME_WIDTH, _pt(y1) + 2 * FRAME_WIDTH)
+        if handwritten:
+            prefix, _, value = text.rpartition(" ")
+            x = inner[0]
+            if prefix:
+                draw.text((x, inner[1] + 8), prefix, fill=(20, 20, 20), font=self.small_font)
+                x += int(draw.textlength(prefix + " ", font=self.small_font))
+            self._handwrite(img, value, (x, inner[1] - 6), rng)
+        else:
+            draw.text(inner, text, fill=(15, 15, 15), font=self.print_font if label == "question_num" else self.small_font)
+        return {"label": label, "text": text, "bbox_pt": [x1, y1, x2, y2]}
+
+    def _handwrite(self, img: Image.Image, text: str, origin: Tuple[int, int], rng: random.Random):
+        # one glyph at a time with its own slant, size, baseline and ink
+        x, y = origin
+        for ch in text:
+            size = int(self.hand_font.size * rng.uniform(0.85, 1.1))
+            glyph = Image.new("L", (size, int(size * 1.3)), 0)
+            ImageDraw.Draw(glyph).text((size * 0.1, 0), ch, fill=255, font=self.hand_font.font_variant(size=size),
+                                       stroke_width=rng.randint(0, 2), stroke_fill=255)
+            glyph = glyph.rotate(rng.uniform(-14, 14), resample=Image.BICUBIC, expand=True)
+            # dark blue-black ink: too dark to be mistaken for a field frame by the stub detector
+            ink = Image.new("RGB", glyph.size, (rng.randint(10, 30), rng.randint(15, 35), rng.randint(40, 60)))
+            img.paste(ink, (x, y + rng.randint(-4, 4)), glyph)
+            x += int(glyph.size[0] * rng.uniform(0.6, 0.75))
+
+    def _scribble(self, draw: ImageDraw.ImageDraw, box: Tuple[float, float, float, float], rng: random.Random):
+        # wavy "answer" lines in pencil grey
+        x1, y1, x2, y2 = (_pt(v) for v in box)
+        y = y1
+        while y < y2:
+            x = x1
+            points = []
+            end = rng.randint((x1 + x2) // 2, x2)
+            while x < end:
+                points.append((x, y + rng.randint(-6, 6)))
+                x += rng.randint(8, 20)
+            if len(points) > 1:
+                draw.line(points, fill=(90, 90, 95), width=3)
+            y += rng.randint(38, 52)
+
+
+def page_results(truth: Dict[str, Any], render_scale: float) -> List[Dict[str, Any]]:
+    """
+    The page results a perfect detector + recognizer would produce for the ground truth
+    (same structure as ocr.process_and_ocr_images pages, bboxes in render_scale pixels).
+    """
+    out = []
+    for page in truth["pages"]:
+        results = [Detection.from_ocr(f["label"], [int(v * render_scale) for v in f["bbox_pt"]], [(f["text"], 0.99)],
+                                      page=page["page"])
+                   for f in page["fields"]]
+        out.append({"page": page["page"], "page_folder": None, "results": results})
+    return out
+
+
+
+def assignment_inputs(questions: int, grades_per_question: int = 3, pages: int = 50,
+                      seed: int = 0) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Large (questions, grades) inputs for StudentUtils.assign_grades_to_questions, in the structure
+    extract_from_pages builds: questions spread over the pages, grades scattered in random order
+    (a few above the first question), duplicate positions and confidences included.
+    """
+    rng = random.Random(seed)
+    height = 3500
+    qs = [{"qnum": str(i + 1), "max_marks": rng.randint(4, 20), "page": rng.randint(1, pages),
+           "y": rng.randint(0, height), "q_crop": None} for i in range(questions)]
+    grades = [{"text": german_number(rng.randint(0, 40) / 2), "conf": rng.choice([0.5, 0.8, 0.9, 0.99]),
+               "page": rng.randint(1, pages), "y": rng.randint(0, height), "g_crop": None}
+              for _ in range(questions * grades_per_question)]
+    return qs, grades
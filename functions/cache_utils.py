@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+from functions.config import PAGE_CACHE_DIR, PAGE_CACHE_MAX_MB
+from functions.detection_record import Detection
+from functions.model_registry import ModelRegistry
+
+# Seconds after which the size index is rebuilt from the cache folder: page worker processes
+# store entries too, each process only adds its own ones to its index
+_INDEX_MAX_AGE = 30.0
+
+
+def _link_or_copy(src: Path, dst: Path):
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class CacheUtils:
+    """
+    Persistent cache of per-page YOLO+OCR results, keyed by the rendered page content,
+    the model version and the preprocessing parameters.
+    Entry layout: PAGE_CACHE_DIR/<key[:2]>/<key>/{result.json, detected.jpg, crops/...}
+    Evicts least recently used entries once the cache grows beyond PAGE_CACHE_MAX_MB.
+    """
+    _lock = threading.Lock()
+    _index: Optional[Dict[str, Tuple[int, float]]] = None  # key -> (size_bytes, last_used)
+    _scanned_at = 0.0
+
+    def page_key(img: np.ndarray, params: Dict[str, Any]) -> str:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{img.shape}|{img.dtype}|".encode())
+        h.update(np.ascontiguousarray(img).data)
+        h.update(ModelRegistry.model_version().encode())
+        h.update(json.dumps(params, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def _entry_dir(key: str) -> Path:
+        return Path(PAGE_CACHE_DIR) / key[:2] / key
+
+    def load(key: str, page_folder: Path, page: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached page result with its files linked into page_folder, or None on a miss.
+        Same structure as ocr.process_and_ocr_images pages (without "page"/"page_folder");
+        page is set on the restored Detection records (entries are keyed by content, not page number).
+        """
+        entry = CacheUtils._entry_dir(key)
+        meta_path = entry / "result.json"
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            for rel in meta["files"]:
+                _link_or_copy(entry / rel, page_folder / rel)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        def restore(rel: Optional[str]) -> Optional[str]:
+            return str(page_folder / rel) if rel else None
+
+        results = [
+            Detection.from_ocr(item["label"], item["bbox"], item["text"], page=page,
+                               image_path=restore(item.get("image_file")), raw_path=restore(item.get("raw_file")))
+            for item in meta["results"]
+        ]
+
+        now = time.time()
+        try:
+            os.utime(meta_path, (now, now))
+        except OSError:
+            pass
+        with CacheUtils._lock:
+            index = CacheUtils._get_index()
+            if key in index:
+                index[key] = (index[key][0], now)
+
+        (page_folder / "crops").mkdir(parents=True, exist_ok=True)
+        return {
+            "original": None,
+            "detected_image": restore(meta.get("detected_file")),
+            "cropped_folder": str(page_folder / "crops"),
+            "results": results,
+            "low_confidence": meta.get("low_confidence", []),
+        }
+
+    def store(key: str, page_result: Dict[str, Any], page_folder: Path):
+        """Store a fresh page result (and the files it references inside page_folder)."""
+        entry = CacheUtils._entry_dir(key)
+        if entry.exists():
+            return
+        tmp = entry.parent / f".{key}.{uuid4().hex}.tmp"
+        files = []
+
+        def keep(path) -> Optional[str]:
+            if not path or not Path(path).exists():
+                return None
+            try:
+                rel = Path(path).resolve().relative_to(page_folder.resolve()).as_posix()
+            except ValueError:
+                return None
+            _link_or_copy(Path(path), tmp / rel)
+            files.append(rel)
+            return rel
+
+        try:
+            tmp.mkdir(parents=True, exist_ok=True)
+            meta = {
+                "detected_file": keep(page_result.get("detected_image")),
+                "results": [
+                    {
+                        "label": item.label,
+                        "text": [list(t) for t in item.candidates],
+                        "bbox": item.bbox,
+                        "image_file": keep(item.image_path),
+                        "raw_file": keep(item.raw_path),
+                    }
+                    for item in page_result.get("results", [])
+                ],
+                "low_confidence": page_result.get("low_confidence", []),
+                "files": files,
+            }
+            with open(tmp / "result.json", "w", encoding="utf-8") as f:
+                json.dump(meta, f, default=float)
+            size = sum(p.stat().st_size for p in tmp.rglob("*") if p.is_file())
+            os.rename(tmp, entry)
+        except OSError:
+            # another worker stored the same page first, or the cache volume is unavailable
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        with CacheUtils._lock:
+            CacheUtils._get_index()[key] = (size, time.time())
+            CacheUtils._evict()
+
+    def _get_index(max_age: Optional[float] = None) -> Dict[str, Tuple[int, float]]:
+        # built from the cache folder, rebuilt once older than max_age seconds; caller holds _lock
+        if CacheUtils._index is None or (max_age is not None and time.time() - CacheUtils._scanned_at > max_age):
+            index: Dict[str, Tuple[int, float]] = {}
+            root = Path(PAGE_CACHE_DIR)
+            if root.exists():
+                for meta_path in root.glob("*/*/result.json"):
+                    entry = meta_path.parent
+                    try:
+                        size = sum(p.stat().st_size for p in entry.rglob("*") if p.is_file())
+                        index[entry.name] = (size, meta_path.stat().st_mtime)
+                    except OSError:
+                        continue
+            CacheUtils._index = index
+            CacheUtils._scanned_at = time.time()
+        return CacheUtils._index
+
+    def _evict():
+        # caller holds _lock
+        index = CacheUtils._get_index(_INDEX_MAX_AGE)
+        max_bytes = PAGE_CACHE_MAX_MB * 1024 * 1024
+        total = sum(size for size, _ in index.values())
+        if total <= max_bytes:
+            return
+        # evict by the current folder content (entries stored or evicted by other processes, their last use)
+        index = CacheUtils._get_index(0.0)
+        total = sum(size for size, _ in index.values())
+        if total <= max_bytes:
+            return
+        for key, (size, _) in sorted(index.items(), key=lambda kv: kv[1][1]):
+            shutil.rmtree(CacheUtils._entry_dir(key), ignore_errors=True)
+            del index[key]
+            total -= size
+            if total <= max_bytes:
+                break
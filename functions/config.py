@@ -0,0 +1,125 @@
+import logging
+import os
+
+# --------------------------
+# Runtime configuration (overridable through environment variables)
+# --------------------------
+
+def _parse_class_conf(value: str) -> dict:
+    # "label:conf,label:conf" -> {label: conf}; malformed entries are logged and skipped
+    result = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        label, sep, conf = item.partition(":")
+        try:
+            if not sep or not label.strip():
+                raise ValueError
+            result[label.strip()] = float(conf)
+        except ValueError:
+            logging.getLogger(__name__).warning(
+                "Ignoring invalid EXAM_DETECT_CLASS_CONF entry %r (expected label:conf)", item.strip())
+    return result
+
+
+# Number of uploads processed concurrently by the background job pool
+JOB_WORKERS = int(os.getenv("EXAM_JOB_WORKERS", "2"))
+# Finished / failed jobs (status, result, event log) are dropped from memory after EXAM_JOB_TTL seconds,
+# and the oldest ones beyond EXAM_MAX_FINISHED_JOBS right away (their files stay on disk)
+JOB_TTL = float(os.getenv("EXAM_JOB_TTL", str(24 * 3600)))
+MAX_FINISHED_JOBS = int(os.getenv("EXAM_MAX_FINISHED_JOBS", "200"))
+
+# Pages per YOLO predict call when a whole PDF is detected in batches
+YOLO_BATCH_SIZE = int(os.getenv("EXAM_YOLO_BATCH_SIZE", "8"))
+
+# Crops per docTR recognition call
+OCR_BATCH_SIZE = int(os.getenv("EXAM_OCR_BATCH_SIZE", "64"))
+
+# Hand rendered pages and crops from render -> YOLO -> OCR as arrays instead of JPEG files
+IN_MEMORY_PIPELINE = os.getenv("EXAM_IN_MEMORY_PIPELINE", "1") == "1"
+
+# Write every intermediate artifact (page.jpg, preprocessed crops) even in in-memory mode
+DEBUG_ARTIFACTS = os.getenv("EXAM_DEBUG_ARTIFACTS", "0") == "1"
+
+# Worker processes for rendering + detection + OCR of page ranges (<= 1: in-process)
+PAGE_WORKERS = int(os.getenv("EXAM_PAGE_WORKERS", "0"))
+
+# Maximum pages handed to one page worker at a time
+PAGE_RANGE_SIZE = int(os.getenv("EXAM_PAGE_RANGE_SIZE", "16"))
+
+# YOLO weights used by the detector
+YOLO_WEIGHTS = os.getenv("EXAM_YOLO_WEIGHTS", "weights/best.pt")
+
+# docTR recognition architecture
+RECOGNIZER_ARCH = os.getenv("EXAM_RECOGNIZER_ARCH", "crnn_vgg16_bn")
+# Crops of these labels are read by a second, lighter recognizer that only decodes DIGIT_CHARSET
+# ("0": every crop goes through the general recognizer)
+DIGIT_OCR = os.getenv("EXAM_DIGIT_OCR", "1") == "1"
+DIGIT_LABELS = tuple(l for l in os.getenv("EXAM_DIGIT_LABELS", "grades,Mat_num,seat_num").split(",") if l)
+DIGIT_RECOGNIZER_ARCH = os.getenv("EXAM_DIGIT_RECOGNIZER_ARCH", "crnn_mobilenet_v3_small")
+DIGIT_CHARSET = "0123456789,.:"
+# Crops per digit recognition call (the crops are small: larger batches than EXAM_OCR_BATCH_SIZE)
+DIGIT_OCR_BATCH_SIZE = int(os.getenv("EXAM_DIGIT_OCR_BATCH_SIZE", "128"))
+
+# Load the models in the background right after API startup
+WARM_UP_ON_STARTUP = os.getenv("EXAM_WARM_UP_ON_STARTUP", "1") == "1"
+
+# pypdfium2 render scale of the pages fed to YOLO/OCR (1 = 72 dpi)
+RENDER_SCALE = float(os.getenv("EXAM_RENDER_SCALE", "4"))
+# Two-resolution mode: YOLO runs on the page rendered at this scale and only the detected boxes are
+# re-rendered at EXAM_RENDER_SCALE for OCR and the spreadsheets ("0": whole page at EXAM_RENDER_SCALE)
+DETECT_SCALE = float(os.getenv("EXAM_DETECT_SCALE", "1.5"))
+# Margin in PDF points added around each detected box before it is re-rendered
+ROI_PADDING = float(os.getenv("EXAM_ROI_PADDING", "1"))
+
+# Pre-inference page screening on a SCREEN_WIDTH px wide grayscale copy of each render: pages with fewer
+# than EXAM_BLANK_INK_RATIO ink pixels (EXAM_BLANK_INK_DELTA darker than the background) skip YOLO/OCR;
+# pages whose perceptual hash is within EXAM_DUPLICATE_MAX_DISTANCE (of 256) bits of one of the
+# EXAM_DUPLICATE_WINDOW previous pages are flagged as possible duplicate scans in the page check
+PAGE_SCREENING = os.getenv("EXAM_PAGE_SCREENING", "1") == "1"
+SCREEN_WIDTH = int(os.getenv("EXAM_SCREEN_WIDTH", "600"))
+BLANK_INK_RATIO = float(os.getenv("EXAM_BLANK_INK_RATIO", "0.0003"))
+BLANK_INK_DELTA = int(os.getenv("EXAM_BLANK_INK_DELTA", "80"))
+DUPLICATE_WINDOW = int(os.getenv("EXAM_DUPLICATE_WINDOW", "2"))
+DUPLICATE_MAX_DISTANCE = int(os.getenv("EXAM_DUPLICATE_MAX_DISTANCE", "10"))
+
+# YOLO boxes: predict() drops boxes below EXAM_DETECT_MIN_CONF; boxes below EXAM_DETECT_CONF (or the
+# per-label value of EXAM_DETECT_CLASS_CONF, e.g. "grades:0.5,Mat_num:0.4") are not cropped or OCRed
+# but counted as low confidence in the job result
+DETECT_CONF = float(os.getenv("EXAM_DETECT_CONF", "0.25"))
+DETECT_CLASS_CONF = _parse_class_conf(os.getenv("EXAM_DETECT_CLASS_CONF", ""))
+# lowered to the smallest threshold, otherwise boxes between the two would never reach the filter
+DETECT_MIN_CONF = min(float(os.getenv("EXAM_DETECT_MIN_CONF", "0.1")), DETECT_CONF, *DETECT_CLASS_CONF.values())
+# Non-maximum suppression: IoU threshold, class-agnostic suppression, boxes per page
+DETECT_IOU = float(os.getenv("EXAM_DETECT_IOU", "0.7"))
+DETECT_AGNOSTIC_NMS = os.getenv("EXAM_DETECT_AGNOSTIC_NMS", "0") == "1"
+DETECT_MAX_DET = int(os.getenv("EXAM_DETECT_MAX_DET", "300"))
+# Labels that are cropped and OCRed, other classes are not even returned by predict() ("": all)
+OCR_LABELS = tuple(l for l in os.getenv("EXAM_OCR_LABELS", "page_number,Mat_num,seat_num,question_num,grades").split(",") if l)
+
+# Persistent cache of per-page detection + OCR results (keyed by rendered page content)
+PAGE_CACHE_ENABLED = os.getenv("EXAM_PAGE_CACHE", "1") == "1"
+PAGE_CACHE_DIR = os.getenv("EXAM_PAGE_CACHE_DIR", "cache/pages")
+PAGE_CACHE_MAX_MB = int(os.getenv("EXAM_PAGE_CACHE_MAX_MB", "2048"))
+
+# Write the result spreadsheets in one pass with openpyxl write-only worksheets
+STREAMING_EXCEL = os.getenv("EXAM_STREAMING_EXCEL", "1") == "1"
+
+# Embed crops into the result spreadsheets as small JPEG thumbnails (120x90 display box)
+EXCEL_THUMBNAILS = os.getenv("EXAM_EXCEL_THUMBNAILS", "1") == "1"
+EXCEL_THUMB_QUALITY = int(os.getenv("EXAM_EXCEL_THUMB_QUALITY", "80"))
+# Embed crops in the combined all_students_results.xlsx ("0": link to the crop files instead)
+COMBINED_EXCEL_IMAGES = os.getenv("EXAM_COMBINED_EXCEL_IMAGES", "1") == "1"
+
+# Worker processes writing the per-student PDFs/workbooks (<= 1: written in the job thread)
+ARTIFACT_WORKERS = int(os.getenv("EXAM_ARTIFACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Pipelined mode: render, YOLO+OCR and student grouping run concurrently (single-process page path)
+PIPELINED = os.getenv("EXAM_PIPELINED", "1") == "1"
+# Pages buffered between two pipeline stages (bounds the rendered pages held in memory)
+PIPELINE_QUEUE_SIZE = int(os.getenv("EXAM_PIPELINE_QUEUE_SIZE", str(2 * YOLO_BATCH_SIZE)))
+# Seconds the detect stage waits for a further rendered page before running a partial YOLO batch
+PIPELINE_BATCH_WAIT = float(os.getenv("EXAM_PIPELINE_BATCH_WAIT", "0.25"))
+
+# Distinct footer texts whose parsed page marker ("Seite X von Y") is kept in memory
+PAGE_MARKER_CACHE_SIZE = int(os.getenv("EXAM_PAGE_MARKER_CACHE_SIZE", "4096"))
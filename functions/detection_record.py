@@ -0,0 +1,64 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+def _path_str(path) -> Optional[str]:
+    return str(Path(path)) if path else None
+
+
+@dataclass(slots=True)
+class Detection:
+    """
+    One detected + recognized field of a page, as produced by the OCR stage (page results' "results").
+    text/conf: the most confident recognition (None when the recognizer returned nothing);
+    candidates: every (text, conf) the recognizer returned for the crop, best first by confidence.
+    image_path: preprocessed crop file (None in in-memory mode), raw_path: raw crop (Excel embedding).
+    """
+    label: str
+    bbox: List[int]
+    page: Optional[int] = None
+    text: Optional[str] = None
+    conf: Optional[float] = None
+    candidates: Tuple[Tuple[str, float], ...] = ()
+    image_path: Optional[str] = None
+    raw_path: Optional[str] = None
+
+    @classmethod
+    def from_ocr(cls, label: str, bbox: Sequence[int], ocr_output: Optional[Sequence[Tuple[str, float]]],
+                 page: Optional[int] = None, image_path=None, raw_path=None) -> "Detection":
+        """Build from the recognizer output of one crop ([(text, conf)], as recognize_crops returns it)."""
+        candidates = tuple((str(t), float(c)) for t, c in (ocr_output or ()))
+        text = conf = None
+        if candidates:
+            # first of equally confident candidates, like max()
+            text, conf = max(candidates, key=lambda x: x[1])
+            candidates = tuple(sorted(candidates, key=lambda x: -x[1]))
+        return cls(label, [int(v) for v in bbox] if bbox is not None else None, page, text, conf, candidates,
+                   _path_str(image_path), _path_str(raw_path))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-ready dict (from_dict restores it)."""
+        return {
+            "label": self.label,
+            "bbox": self.bbox,
+            "page": self.page,
+            "text": self.text,
+            "conf": self.conf,
+            "candidates": [list(c) for c in self.candidates],
+            "image_path": self.image_path,
+            "raw_path": self.raw_path,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Detection":
+        return cls(
+            data["label"],
+            data.get("bbox"),
+            data.get("page"),
+            data.get("text"),
+            data.get("conf"),
+            tuple((t, c) for t, c in data.get("candidates") or ()),
+            data.get("image_path"),
+            data.get("raw_path"),
+        )
@@ -1,9 +1,35 @@
+import hashlib
+import os
+import re
+import zipfile
+from functools import lru_cache
+from io import BytesIO
+
 import pandas as pd
 from openpyxl import load_workbook
+from openpyxl.drawing.image import Image as XLImage
 from openpyxl.styles import PatternFill
-from typing import Optional
+from PIL import Image
+from typing import Dict, Optional
 from pathlib import Path
 
+from functions.config import EXCEL_THUMB_QUALITY
+
+# relationship targets of embedded media, e.g. Target="/xl/media/image3.jpeg" or "../media/image3.png"
+_MEDIA_TARGET = re.compile(r'Target="([^"]*?)media/([^"]+)"')
+
+
+@lru_cache(maxsize=4096)
+def _thumbnail_bytes(path: str, mtime_ns: int, size: int, max_width: int, max_height: int) -> bytes:
+    # mtime/size are part of the key so a rewritten crop is not served from the cache
+    with Image.open(path) as im:
+        im = im.convert("L") if im.mode in ("L", "1", "I;16") else im.convert("RGB")
+        # never upscale the stored pixels; the display size is set by the caller
+        im.thumbnail((max_width, max_height), Image.LANCZOS)
+        buf = BytesIO()
+        im.save(buf, format="JPEG", quality=EXCEL_THUMB_QUALITY, optimize=True)
+        return buf.getvalue()
+
 class ExcelUtils:
     def save_excel_with_highlighting(df: pd.DataFrame, all_flags, all_statuses, all_page_checks, path):
         COLORS = {
@@ -49,5 +75,54 @@ class ExcelUtils:
         uri = p.as_uri()
         # return Excel formula
         return f'=HYPERLINK("{uri}", "{text}")'
-    
 
+    def thumbnail(path: str, max_width: int = 120, max_height: int = 90) -> XLImage:
+        """
+        Spreadsheet image of the crop at path, downsampled to fit max_width x max_height and
+        JPEG encoded (EXAM_EXCEL_THUMB_QUALITY). Encoded thumbnails are cached per file, so a crop
+        embedded in the per-student and in the combined workbook is only decoded once.
+        """
+        st = os.stat(path)
+        data = _thumbnail_bytes(str(Path(path).resolve()), st.st_mtime_ns, st.st_size, max_width, max_height)
+        # openpyxl closes the stream once the image is written, so every image gets its own buffer
+        return XLImage(BytesIO(data))
+
+    def dedupe_media(xlsx_path: Path) -> int:
+        """
+        Rewrite a saved workbook so that byte-identical images (openpyxl writes one media part per
+        embedded image) are stored once and shared by all drawings. Returns the number of parts removed.
+        """
+        xlsx_path = Path(xlsx_path)
+        with zipfile.ZipFile(xlsx_path) as zin:
+            infos = zin.infolist()
+            canonical: Dict[bytes, str] = {}
+            alias: Dict[str, str] = {}  # duplicate media name -> kept media name (relative to xl/media/)
+            for info in infos:
+                if info.filename.startswith("xl/media/"):
+                    digest = hashlib.blake2b(zin.read(info), digest_size=16).digest()
+                    name = info.filename[len("xl/media/"):]
+                    kept = canonical.setdefault(digest, name)
+                    if kept != name:
+                        alias[name] = kept
+            if not alias:
+                return 0
+
+            def retarget(m: re.Match) -> str:
+                return f'Target="{m.group(1)}media/{alias.get(m.group(2), m.group(2))}"'
+
+            tmp = xlsx_path.with_suffix(".dedupe.tmp")
+            with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as zout:
+                for info in infos:
+                    if info.filename.startswith("xl/media/") and info.filename[len("xl/media/"):] in alias:
+                        continue
+                    data = zin.read(info)
+                    if info.filename.startswith("xl/drawings/_rels/"):
+                        data = _MEDIA_TARGET.sub(retarget, data.decode("utf-8")).encode("utf-8")
+                    elif info.filename == "[Content_Types].xml":
+                        text = data.decode("utf-8")
+                        for name in alias:
+                            text = re.sub(rf'<Override[^>]*PartName="/xl/media/{re.escape(name)}"[^>]*/>', "", text)
+                        data = text.encode("utf-8")
+                    zout.writestr(info, data)
+        tmp.replace(xlsx_path)
+        return len(alias)
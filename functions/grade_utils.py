@@ -2,22 +2,41 @@ import re
 from typing import Optional, Tuple, Dict, Any, List
 from functions.question_utils import QuestionUtils
 
+DEFAULT_GRADING_TABLE = [
+    (0,  "5,0"),
+    (50, "4,0"),
+    (55, "3,7"),
+    (60, "3,3"),
+    (65, "3,0"),
+    (70, "2,7"),
+    (75, "2,3"),
+    (80, "2,0"),
+    (85, "1,7"),
+    (90, "1,3"),
+    (95, "1,0"),
+]
+
+# Colors (hex without alpha for openpyxl)
+COLORS = {
+    "full":        "C6EFCE",  # light green
+    "zero":        "C00000",  # deep red (changed from FFC7CE)
+    "no_match":    "EE82EE",  # violet
+    "double_match":"800080",  # purple
+    "invalid":     "FFA07A",  # orange-like for invalid/plausibility
+    "normalized":  "FFA500",  # orange for normalized (distinct)
+    "page_error":  "D3D3D3"   # light gray for page plausibility error
+}
+
+# Font color overrides for readability
+FONT_COLORS = {
+    "double_match": "FFFFFF",  # white on purple
+    "zero": "FFFFFF"  # white on deep red
+}
+
+
 class GradeUtils:
 
     def map_percentage_to_mark(pct: float, table=None) -> str:
-        DEFAULT_GRADING_TABLE = [
-            (0,  "5,0"),
-            (50, "4,0"),
-            (55, "3,7"),
-            (60, "3,3"),
-            (65, "3,0"),
-            (70, "2,7"),
-            (75, "2,3"),
-            (80, "2,0"),
-            (85, "1,7"),
-            (90, "1,3"),
-            (95, "1,0"),
-        ]
         if table is None:
             table = DEFAULT_GRADING_TABLE
         for min_pct, grade in table:
@@ -105,4 +124,4 @@ class GradeUtils:
         except ValueError:
             return s, None
 
-        
\ No newline at end of file
+        
\ No newline at end of file
@@ -0,0 +1,138 @@
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from functions.config import JOB_TTL, MAX_FINISHED_JOBS
+
+
+class JobManager:
+    """
+    Run long-running pipeline calls on a bounded worker pool, off the event loop.
+    Jobs are kept in memory: { job_id: {status, progress, result, error, timestamps, events} }
+    status: queued -> running -> done | failed
+    events: ordered log {"seq", "event", "t" (seconds since submit), **data} read by the SSE endpoint;
+    every progress update is logged as a "progress" event, the pipeline adds its own
+    (page_rendered, page_detected, page_ocr, student_finalized, export_written), and the job ends
+    with a "status" event.
+    Finished and failed jobs are pruned after ttl seconds, and beyond max_finished (oldest first);
+    a pruned job is unknown (None) like one that never existed.
+    """
+
+    def __init__(self, max_workers: int = 2, ttl: float = JOB_TTL, max_finished: int = MAX_FINISHED_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="exam-job")
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.ttl = ttl
+        self.max_finished = max_finished
+
+    def submit(self, job_id: str, fn: Callable[..., Dict[str, Any]], *args, **kwargs) -> str:
+        """
+        Register a job and queue fn(*args, progress=<callback>, **kwargs) on the pool.
+        The callback accepts keyword fields that are merged into the job progress.
+        """
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "progress": {
+                    "stage": "queued",
+                    "pages_total": None,
+                    "pages_done": 0,
+                    "students_total": None,
+                    "students_done": 0,
+                },
+                "result": None,
+                "error": None,
+                "events": [],
+            }
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable[..., Dict[str, Any]], args, kwargs):
+        self._set(job_id, status="running", started_at=time.time())
+        try:
+            result = fn(*args, progress=partial(self.update_progress, job_id), **kwargs)
+            self.update_progress(job_id, stage="done")
+            self._set(job_id, status="done", result=result, finished_at=time.time())
+            self._log(job_id, "status", {"status": "done"})
+            with self._lock:
+                self._prune()
+        except Exception as e:
+            traceback.print_exc()
+            self.update_progress(job_id, stage="failed")
+            self._set(job_id, status="failed", error=str(e), finished_at=time.time())
+            self._log(job_id, "status", {"status": "failed", "error": str(e)})
+            with self._lock:
+                self._prune()
+
+    def _prune(self):
+        # caller holds _lock
+        finished = sorted((job["finished_at"], job_id) for job_id, job in self._jobs.items()
+                          if job["status"] in ("done", "failed") and job["finished_at"] is not None)
+        cutoff = time.time() - self.ttl
+        excess = len(finished) - max(0, self.max_finished)
+        for i, (finished_at, job_id) in enumerate(finished):
+            if i < excess or finished_at < cutoff:
+                del self._jobs[job_id]
+
+    def _set(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def update_progress(self, job_id: str, event: Optional[str] = None,
+                        event_data: Optional[Dict[str, Any]] = None, **fields):
+        """
+        Merge fields into the job progress (logged as a "progress" event with the full progress),
+        and/or log a pipeline event: progress(event="page_ocr", event_data={"page": 3, "seconds": 0.2}).
+        """
+        if fields:
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return
+                job["progress"].update(fields)
+                snapshot = dict(job["progress"])
+            self._log(job_id, "progress", snapshot)
+        if event:
+            self._log(job_id, event, event_data or {})
+
+    def _log(self, job_id: str, event: str, data: Dict[str, Any]):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                events = job["events"]
+                events.append({"seq": len(events) + 1, "event": event,
+                               "t": round(time.time() - job["created_at"], 3), **data})
+
+    def events_since(self, job_id: str, seq: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """Events with a sequence number above seq (None if the job is unknown)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return job["events"][seq:]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Status snapshot (without the result payload) or None if the job is unknown (or pruned).
+        """
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = {k: v for k, v in job.items() if k not in ("result", "events")}
+            snapshot["progress"] = dict(job["progress"])
+            return snapshot
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job["result"] if job else None
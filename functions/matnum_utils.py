@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
 
 class MatNumUtils:
     def split_pages_by_matnum(pages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
@@ -13,7 +13,7 @@ class MatNumUtils:
         for page in pages:
             page_has_mat = False
             for item in page.get("results", []):
-                if item.get("label") == "Mat_num" and item.get("text"):
+                if item.label == "Mat_num" and item.text is not None:
                     page_has_mat = True
                     break
 
@@ -30,3 +30,19 @@ class MatNumUtils:
         if not found_any:
             return [pages]
         return groups
+
+    def iter_groups(pages: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Incremental split_pages_by_matnum: consumes pages in order and yields each group as soon as
+        the next Mat_num page starts a new one (the last group once pages are exhausted).
+        Same groups as split_pages_by_matnum for any non-empty page list.
+        """
+        current: List[Dict[str, Any]] = []
+        for page in pages:
+            page_has_mat = any(item.label == "Mat_num" and item.text is not None for item in page.get("results", []))
+            if page_has_mat and current:
+                yield current
+                current = []
+            current.append(page)
+        if current:
+            yield current
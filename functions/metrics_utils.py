@@ -0,0 +1,199 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+try:
+    import psutil
+    _process = psutil.Process()
+except ImportError:  # memory figures are left out
+    psutil = None
+    _process = None
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Timed pipeline stages -> unit of their item count
+STAGES = {
+    "pdf_save": "bytes",
+    "page_render": "pages",
+    "page_screen": "pages",
+    "region_render": "regions",
+    "jpeg_save": "files",
+    "model_predict": "pages",
+    "crop_preprocess": "crops",
+    "recognition": "crops",
+    "digit_recognition": "crops",
+    "extract_from_pages": "pages",
+    "excel_write": "students",
+    "primus_write": "students",
+    "pdf_assembly": "pages",
+    "zip": "bytes",
+}
+
+
+def _rss() -> Optional[int]:
+    if _process is None:
+        return None
+    try:
+        return _process.memory_info().rss
+    except Exception:
+        return None
+
+
+def _peak_rss() -> Optional[int]:
+    if resource is not None:
+        # ru_maxrss is in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    if _process is not None:
+        return getattr(_process.memory_info(), "peak_wset", None)  # Windows
+    return None
+
+
+class JobMetrics:
+    """
+    Stage breakdown of one job (or of the whole process, see Metrics):
+    stage -> {"calls", "wall_seconds", "cpu_seconds", "items", "peak_rss_bytes"}.
+    cpu_seconds is the CPU time of the thread that ran the stage (torch/OpenCV helper threads are
+    not included); peak_rss_bytes is the largest process RSS seen when one of its spans ended.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._created = time.perf_counter()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, stage: str, wall: float, cpu: float, items: int = 0, calls: int = 1, rss: Optional[int] = None):
+        with self._lock:
+            s = self.stages.setdefault(stage, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                               "items": 0, "peak_rss_bytes": None})
+            s["calls"] += calls
+            s["wall_seconds"] += wall
+            s["cpu_seconds"] += cpu
+            s["items"] += items
+            if rss is not None and (s["peak_rss_bytes"] is None or rss > s["peak_rss_bytes"]):
+                s["peak_rss_bytes"] = rss
+
+    def merge(self, snapshot: Dict[str, Any]):
+        """Add a snapshot() taken elsewhere (e.g. in a pool worker process)."""
+        for stage, s in snapshot.get("stages", {}).items():
+            self.add(stage, s["wall_seconds"], s["cpu_seconds"], s["items"], s["calls"], s["peak_rss_bytes"])
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {name: dict(s, wall_seconds=round(s["wall_seconds"], 4), cpu_seconds=round(s["cpu_seconds"], 4),
+                                 unit=STAGES.get(name))
+                      for name, s in self.stages.items()}
+        peaks = [s["peak_rss_bytes"] for s in stages.values() if s["peak_rss_bytes"] is not None]
+        return {
+            "total_seconds": round(time.perf_counter() - self._created, 3),
+            "peak_rss_bytes": max(peaks, default=None),
+            "stages": stages,
+        }
+
+
+_current_job: ContextVar[Optional[JobMetrics]] = ContextVar("exam_job_metrics", default=None)
+
+
+class StageTimer:
+    """One running span of a stage; stop() records it (process totals + the job it was started in)."""
+
+    def __init__(self, stage: str, items: int = 0):
+        self.stage = stage
+        self.items = items
+        self.job = _current_job.get()
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+
+    def stop(self, items: Optional[int] = None) -> float:
+        wall = time.perf_counter() - self._wall
+        Metrics.record(self.stage, wall, time.thread_time() - self._cpu,
+                       self.items if items is None else items, job=self.job)
+        return wall
+
+
+class Metrics:
+    """
+    Process-wide stage timings (exposed by GET /metrics in the Prometheus text format) and the
+    per-job breakdown returned in the job result ("timings"). The job of the calling code is a
+    context variable: threads started by the pipeline run in a copy of the job thread's context,
+    pool workers collect their own JobMetrics and hand its snapshot back to be merged.
+    """
+    _totals = JobMetrics()
+
+    def start(stage: str, items: int = 0) -> StageTimer:
+        return StageTimer(stage, items)
+
+    @contextmanager
+    def stage(stage: str, items: int = 0) -> Iterator[StageTimer]:
+        """with Metrics.stage("recognition", items=len(crops)): ... (timer.items may be set inside)"""
+        timer = StageTimer(stage, items)
+        try:
+            yield timer
+        finally:
+            timer.stop()
+
+    def record(stage: str, wall: float, cpu: float, items: int = 0, job: Optional[JobMetrics] = None):
+        rss = _rss()
+        Metrics._totals.add(stage, wall, cpu, items, rss=rss)
+        job = job or _current_job.get()
+        if job is not None:
+            job.add(stage, wall, cpu, items, rss=rss)
+
+    @contextmanager
+    def job(metrics: Optional[JobMetrics] = None) -> Iterator[JobMetrics]:
+        """Attribute the stages run inside the block (in this context) to metrics (a new JobMetrics by default)."""
+        metrics = metrics or JobMetrics()
+        token = _current_job.set(metrics)
+        try:
+            yield metrics
+        finally:
+            _current_job.reset(token)
+
+    def current() -> Optional[JobMetrics]:
+        return _current_job.get()
+
+    def merge(snapshot: Optional[Dict[str, Any]], job: Optional[JobMetrics] = None):
+        """Add the snapshot of a pool worker to the process totals and to job (default: the current job)."""
+        if not snapshot:
+            return
+        Metrics._totals.merge(snapshot)
+        job = job or _current_job.get()
+        if job is not None:
+            job.merge(snapshot)
+
+    def prometheus() -> str:
+        """Text exposition format (version 0.0.4) of the process totals."""
+        stages = Metrics._totals.snapshot()["stages"]
+        lines = []
+
+        def family(name: str, kind: str, help_text: str, field: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for stage in sorted(stages):
+                value = stages[stage][field]
+                if value is not None:
+                    lines.append(f'{name}{{stage="{stage}",unit="{STAGES.get(stage, "")}"}} {value}')
+
+        family("exam_stage_calls_total", "counter", "Timed spans of a pipeline stage.", "calls")
+        family("exam_stage_wall_seconds_total", "counter", "Wall time spent in a pipeline stage.", "wall_seconds")
+        family("exam_stage_cpu_seconds_total", "counter", "CPU time of the threads running a pipeline stage.", "cpu_seconds")
+        family("exam_stage_items_total", "counter", "Items processed by a pipeline stage (see the unit label).", "items")
+        family("exam_stage_peak_rss_bytes", "gauge", "Largest process RSS seen at the end of a stage span.", "peak_rss_bytes")
+
+        lines.append("# HELP exam_process_cpu_seconds_total CPU time of the API process (all threads).")
+        lines.append("# TYPE exam_process_cpu_seconds_total counter")
+        lines.append(f"exam_process_cpu_seconds_total {time.process_time()}")
+        rss, peak = _rss(), _peak_rss()
+        if rss is not None:
+            lines.append("# HELP exam_process_resident_memory_bytes Current RSS of the API process.")
+            lines.append("# TYPE exam_process_resident_memory_bytes gauge")
+            lines.append(f"exam_process_resident_memory_bytes {rss}")
+        if peak is not None:
+            lines.append("# HELP exam_process_peak_resident_memory_bytes Peak RSS of the API process.")
+            lines.append("# TYPE exam_process_peak_resident_memory_bytes gauge")
+            lines.append(f"exam_process_peak_resident_memory_bytes {peak}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from functions.config import (YOLO_WEIGHTS, RECOGNIZER_ARCH, DIGIT_OCR, DIGIT_LABELS, DIGIT_RECOGNIZER_ARCH,
+                              DIGIT_CHARSET)
+
+
+class _RestrictedDecoder:
+    """
+    Wraps the postprocessor of a docTR recognition model: logits of vocab characters outside charset
+    are set to -inf before decoding, so only charset (and the model's special tokens) can be emitted.
+    """
+
+    def __init__(self, postprocessor, vocab: str, charset: str):
+        self.postprocessor = postprocessor
+        self.blocked = [i for i, ch in enumerate(vocab) if ch not in charset]
+
+    def __call__(self, logits):
+        logits = logits.clone()
+        logits[..., self.blocked] = float("-inf")
+        return self.postprocessor(logits)
+
+
+class ModelRegistry:
+    """
+    Single place that owns the YOLO detector and the docTR recognizers (general + digit-only).
+    Models are loaded lazily on first use (or eagerly through warm_up) so that importing
+    the routes stays cheap; ultralytics / docTR themselves are only imported on load.
+    """
+    _lock = threading.Lock()
+    _models: Dict[str, Any] = {}
+    _load_seconds: Dict[str, float] = {}
+    _errors: Dict[str, str] = {}
+    _version: Optional[str] = None
+
+    def _load(name: str, loader) -> Any:
+        model = ModelRegistry._models.get(name)
+        if model is not None:
+            return model
+        with ModelRegistry._lock:
+            model = ModelRegistry._models.get(name)
+            if model is None:
+                t0 = time.perf_counter()
+                try:
+                    model = loader()
+                except Exception as e:
+                    ModelRegistry._errors[name] = str(e)
+                    raise RuntimeError(f"Loading {name} model failed: {e}")
+                ModelRegistry._errors.pop(name, None)
+                ModelRegistry._load_seconds[name] = round(time.perf_counter() - t0, 3)
+                ModelRegistry._models[name] = model
+            return model
+
+    def get_detector():
+        """YOLO model from EXAM_YOLO_WEIGHTS."""
+        def load():
+            from ultralytics import YOLO
+            return YOLO(YOLO_WEIGHTS)
+        return ModelRegistry._load("detector", load)
+
+    def get_recognizer():
+        """docTR recognition predictor (EXAM_RECOGNIZER_ARCH)."""
+        def load():
+            from doctr.models import recognition_predictor
+            return recognition_predictor(RECOGNIZER_ARCH, pretrained=True)
+        return ModelRegistry._load("recognizer", load)
+
+    def get_digit_recognizer():
+        """docTR recognition predictor (EXAM_DIGIT_RECOGNIZER_ARCH) restricted to DIGIT_CHARSET."""
+        def load():
+            from doctr.models import recognition_predictor
+            predictor = recognition_predictor(DIGIT_RECOGNIZER_ARCH, pretrained=True)
+            model = predictor.model
+            model.postprocessor = _RestrictedDecoder(model.postprocessor, model.vocab, DIGIT_CHARSET)
+            return predictor
+        return ModelRegistry._load("digit_recognizer", load)
+
+    def model_names() -> Tuple[str, ...]:
+        return ("detector", "recognizer", "digit_recognizer") if DIGIT_OCR else ("detector", "recognizer")
+
+    def use(name: str, model: Any):
+        """Install an already built model ("detector" / "recognizer" / "digit_recognizer") instead of loading it, e.g. a benchmark stub."""
+        with ModelRegistry._lock:
+            ModelRegistry._models[name] = model
+            ModelRegistry._load_seconds[name] = 0.0
+            ModelRegistry._errors.pop(name, None)
+
+    def warm_up():
+        """Load every model now (startup hook / worker initializer); raises if any failed."""
+        failed = []
+        getters = {"detector": ModelRegistry.get_detector, "recognizer": ModelRegistry.get_recognizer,
+                   "digit_recognizer": ModelRegistry.get_digit_recognizer}
+        for getter in (getters[name] for name in ModelRegistry.model_names()):
+            try:
+                getter()
+            except RuntimeError as e:
+                failed.append(str(e))
+        if failed:
+            raise RuntimeError("; ".join(failed))
+
+    def model_version() -> str:
+        """
+        Identity of the configured models (content hash of the YOLO weights + recognizer archs).
+        Computed without loading the models; used to key cached results.
+        """
+        if ModelRegistry._version is None:
+            h = hashlib.sha1()
+            if os.path.exists(YOLO_WEIGHTS):
+                with open(YOLO_WEIGHTS, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        h.update(chunk)
+            else:
+                h.update(YOLO_WEIGHTS.encode())
+            version = f"yolo:{h.hexdigest()[:16]}|doctr:{RECOGNIZER_ARCH}"
+            if DIGIT_OCR:
+                version += f"|digits:{DIGIT_RECOGNIZER_ARCH}:{DIGIT_CHARSET}:{','.join(sorted(DIGIT_LABELS))}"
+            ModelRegistry._version = version
+        return ModelRegistry._version
+
+    def status() -> Dict[str, Any]:
+        """Readiness per model: {"ready": bool, "models": {name: {"loaded", "load_seconds", "error"}}}"""
+        models = {}
+        for name in ModelRegistry.model_names():
+            models[name] = {
+                "loaded": name in ModelRegistry._models,
+                "load_seconds": ModelRegistry._load_seconds.get(name),
+                "error": ModelRegistry._errors.get(name),
+            }
+        return {"ready": all(m["loaded"] for m in models.values()), "models": models}
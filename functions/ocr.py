@@ -1,12 +1,14 @@
+import time
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 from PIL import Image
-from .yolo_detection import process_image_with_yolo
+from .yolo_detection import RegionRenderer, process_image_with_yolo, process_images_with_yolo_batch
 
-from doctr.models import recognition_predictor
-from doctr.io import DocumentFile
-
-
-model = recognition_predictor(pretrained=True)
+from functions.config import OCR_BATCH_SIZE, DIGIT_OCR, DIGIT_LABELS, DIGIT_OCR_BATCH_SIZE
+from functions.detection_record import Detection
+from functions.metrics_utils import Metrics
+from functions.model_registry import ModelRegistry
 
 # # Initialize the OCR predictor once
 # from transformers import TrOCRProcessor, VisionEncoderDecoderModel
@@ -15,38 +17,101 @@ model = recognition_predictor(pretrained=True)
 # processor = TrOCRProcessor.from_pretrained('microsoft/trocr-base-handwritten')
 # ocr_model = VisionEncoderDecoderModel.from_pretrained('microsoft/trocr-base-handwritten')
 
-def process_and_ocr_image(image_path: str, output_dir: Path = None) -> dict:
-    yolo_result = process_image_with_yolo(image_path, output_dir=output_dir)
+def recognize_crops(crops: List[np.ndarray], batch_size: Optional[int] = None,
+                    digits: bool = False) -> List[List[Tuple[str, float]]]:
+    """
+    Run the recognition predictor over many crops (RGB arrays) with one call per batch_size crops.
+    Returns, per crop, the same [(text, conf)] list that model(DocumentFile.from_images(path)) gives.
+    digits: use the digit-only recognizer (batches of EXAM_DIGIT_OCR_BATCH_SIZE by default).
+    """
+    if digits:
+        model, stage, default_batch = ModelRegistry.get_digit_recognizer(), "digit_recognition", DIGIT_OCR_BATCH_SIZE
+    else:
+        model, stage, default_batch = ModelRegistry.get_recognizer(), "recognition", OCR_BATCH_SIZE
+    outputs: List[List[Tuple[str, float]]] = []
+    step = max(1, batch_size or default_batch)
+    for start in range(0, len(crops), step):
+        batch = crops[start:start + step]
+        with Metrics.stage(stage, items=len(batch)):
+            outputs.extend([pred] for pred in model(batch))
+    return outputs
+
+
+def _recognize_by_label(images: List[np.ndarray], labels: List[str]) -> List[List[Tuple[str, float]]]:
+    # numeric fields (EXAM_DIGIT_LABELS) go through the digit recognizer, the rest through the general one
+    digit_idx = [i for i, label in enumerate(labels) if DIGIT_OCR and label in DIGIT_LABELS]
+    if not digit_idx:
+        return recognize_crops(images)
+    digit_set = set(digit_idx)
+    text_idx = [i for i in range(len(images)) if i not in digit_set]
+    outputs: List[List[Tuple[str, float]]] = [None] * len(images)
+    for idx, digits in ((digit_idx, True), (text_idx, False)):
+        if idx:
+            for i, pred in zip(idx, recognize_crops([images[i] for i in idx], digits=digits)):
+                outputs[i] = pred
+    return outputs
 
-    # Prepare extracted text results
-    extracted_texts = []
 
-    for crop in yolo_result.get("cropped_images", []):
-        label = crop["label"]
-        path = Path(crop["path"])
+def _ocr_yolo_results(yolo_results: List[dict], pages: Optional[List[Optional[int]]] = None) -> List[dict]:
+    """
+    OCR every crop of every page in one batched recognition pass and map texts back
+    onto the crops (one Detection per crop). pages: page number of each yolo result, if known.
+    """
+    all_crops = [crop for yr in yolo_results for crop in yr.get("cropped_images", [])]
+    # in-memory crops are used as they are, the others are read from their preprocessed file
+    on_disk = [crop for crop in all_crops if crop.get("image") is None]
+    if on_disk:
+        from doctr.io import DocumentFile
+    loaded = iter(DocumentFile.from_images([Path(crop["path"]) for crop in on_disk]) if on_disk else [])
+    images = [crop["image"] if crop.get("image") is not None else next(loaded) for crop in all_crops]
+    texts = iter(_recognize_by_label(images, [crop["label"] for crop in all_crops]))
 
-        raw_path = Path(crop["raw_path"])
-        # print(raw_path)
+    page_outputs = []
+    for i, yolo_result in enumerate(yolo_results):
+        # Prepare extracted text results
+        extracted_texts = []
+        page = pages[i] if pages else None
 
-        image = DocumentFile.from_images(path)
-        # pixel_values = processor(images=image, return_tensors="pt").pixel_values
-        # generated_ids = ocr_model.generate(pixel_values)
-        # result = processor.batch_decode(generated_ids, skip_special_tokens=True)
-        result=model(image)
+        for crop in yolo_result.get("cropped_images", []):
+            extracted_texts.append(Detection.from_ocr(crop["label"], crop.get("bbox"), next(texts), page=page,
+                                                      image_path=crop.get("path"), raw_path=crop.get("raw_path")))
 
-        extracted_texts.append({
-            "label": label,
-            "text": result,
-            "bbox": crop.get("bbox"),
-            "image_path": str(path),
-            "raw_path":raw_path
+        page_outputs.append({
+            "original": yolo_result.get("original"),
+            "detected_image": yolo_result.get("detected_image"),
+            "cropped_folder": yolo_result.get("cropped_folder"),
+            "results": extracted_texts,
+            "low_confidence": yolo_result.get("low_confidence", []),
         })
-    
-    return {
-        "original": yolo_result.get("original"),
-        "detected_image": yolo_result.get("detected_image"),
-        "cropped_folder": yolo_result.get("cropped_folder"),
-        "results": extracted_texts
-    }
+    return page_outputs
+
+
+def _ocr_yolo_result(yolo_result: dict) -> dict:
+    return _ocr_yolo_results([yolo_result])[0]
+
+
+def process_and_ocr_image(image_path: str, output_dir: Path = None) -> dict:
+    yolo_result = process_image_with_yolo(image_path, output_dir=output_dir)
+    return _ocr_yolo_result(yolo_result)
 
 
+def process_and_ocr_images(images: List[np.ndarray], output_dirs: List[Path],
+                           image_paths: Optional[List[Optional[str]]] = None,
+                           timings: Optional[Dict[str, float]] = None,
+                           regions: Optional[List[Optional[RegionRenderer]]] = None,
+                           pages: Optional[List[int]] = None) -> List[dict]:
+    """
+    Same as process_and_ocr_image for several rendered pages at once (BGR arrays):
+    YOLO and recognition both run in batches over all pages. One dict per page, in order.
+    timings: filled with the wall time of the batch in seconds ({"detect", "ocr"}).
+    regions: per page, re-renders detected boxes at OCR resolution when images are low resolution
+    detection renders (the re-rendering counts as "detect" time).
+    pages: page numbers stored on the Detection records.
+    """
+    t0 = time.perf_counter()
+    yolo_results = process_images_with_yolo_batch(images, output_dirs, image_paths=image_paths, regions=regions)
+    t1 = time.perf_counter()
+    page_outputs = _ocr_yolo_results(yolo_results, pages)
+    if timings is not None:
+        timings.update(detect=t1 - t0, ocr=time.perf_counter() - t1)
+    return page_outputs
@@ -1,59 +1,149 @@
-import re, difflib
-from typing import Dict, Any, List, Tuple, Optional
+import re
+from functools import lru_cache
+from typing import Dict, Any, Iterable, List, Tuple, Optional
 
-class PageUtils:
-    def fuzzy_contains(text: str, candidates: list[str], cutoff: float = 0.3) -> bool:
-        """
-        Return True if text is fuzzy-close to any candidate.
-        """
-        if not text:
-            return False
-        text = text.lower()
-        for cand in candidates:
-            score = difflib.SequenceMatcher(None, text, cand.lower()).ratio()
-            if score >= cutoff:
-                return True
-        return False
+from functions.config import PAGE_MARKER_CACHE_SIZE
 
-    def parse_page_marker(text: str) -> Optional[Tuple[int, int]]:
-        """
-        Parse 'Seite X von Y' patterns with fuzzy closeness.
-        """
+# "seiteXvonY" / "seiteX/Y" / any two numbers, matched on the normalized text (lowercase, no spaces)
+_VON_RE = re.compile(r"(\d+)\s*von\s*(\d+)")
+_SLASH_RE = re.compile(r"(\d+)\s*/\s*(\d+)")
+_NUMBER_RE = re.compile(r"\d+")
+
+
+class PageMarkerParser:
+    """
+    Footer parser ('Seite X von Y'): the text is normalized (lowercase, spaces removed) and the
+    result per normalized text is kept in a bounded LRU cache, since the same footers recur for
+    every student. The keyword check is a bounded edit distance on the first characters.
+    """
+
+    def __init__(self, keyword: str = "seite", cutoff: float = 0.3, cache_size: int = PAGE_MARKER_CACHE_SIZE):
+        self.keyword = keyword.lower()
+        self.cutoff = cutoff
+        self.prefix_len = len(self.keyword) + 3
+        self._parse = lru_cache(maxsize=max(0, cache_size))(self._parse_normalized)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return text.lower().replace(" ", "")
+
+    def parse(self, text: str) -> Optional[Tuple[int, int]]:
         if not text:
             return None
-        s = text.lower().replace(" ", "")
-
-        # fuzzy check for "seite"
-        if not PageUtils.fuzzy_contains(s[:8], ["seite"]):
+        return self._parse(PageMarkerParser.normalize(text))
+
+    def parse_many(self, texts: Iterable[str]) -> List[Optional[Tuple[int, int]]]:
+        """Parse all footers of a document; every distinct normalized text is parsed once."""
+        results: Dict[str, Optional[Tuple[int, int]]] = {}
+        out = []
+        for text in texts:
+            if not text:
+                out.append(None)
+                continue
+            s = PageMarkerParser.normalize(text)
+            if s not in results:
+                results[s] = self._parse(s)
+            out.append(results[s])
+        return out
+
+    def cache_info(self):
+        return self._parse.cache_info()
+
+    def cache_clear(self):
+        self._parse.cache_clear()
+
+    def _parse_normalized(self, s: str) -> Optional[Tuple[int, int]]:
+        if not PageUtils.fuzzy_match(s[:self.prefix_len], self.keyword, self.cutoff):
             return None
 
-        # standard patterns (seiteXvonY / seiteX/Y)
-        m = re.search(r"(\d+)\s*von\s*(\d+)", s)
+        m = _VON_RE.search(s)
         if m:
             return int(m.group(1)), int(m.group(2))
 
-        m2 = re.search(r"(\d+)\s*/\s*(\d+)", s)
-        if m2:
-            return int(m2.group(1)), int(m2.group(2))
+        m = _SLASH_RE.search(s)
+        if m:
+            return int(m.group(1)), int(m.group(2))
 
         # fallback: first 2 numbers in string
-        nums = re.findall(r"\d+", s)
+        nums = _NUMBER_RE.findall(s)
         if len(nums) >= 2:
             return int(nums[0]), int(nums[1])
 
         return None
+
+
+class PageUtils:
+    def within_edit_distance(a: str, b: str, max_dist: int) -> bool:
+        """
+        True if a can be turned into b with at most max_dist insertions/deletions
+        (len(a) + len(b) - 2 * longest common subsequence). Gives up as soon as the bound is exceeded.
+        """
+        la, lb = len(a), len(b)
+        if abs(la - lb) > max_dist:
+            return False
+        if la + lb <= max_dist:
+            return True
+        prev = [0] * (lb + 1)
+        for i, ca in enumerate(a, 1):
+            cur = [0] * (lb + 1)
+            for j, cb in enumerate(b, 1):
+                cur[j] = prev[j - 1] + 1 if ca == cb else max(prev[j], cur[j - 1])
+            # best case: every remaining character of a still matches
+            if la + lb - 2 * min(lb, cur[lb] + la - i) > max_dist:
+                return False
+            prev = cur
+        return la + lb - 2 * prev[lb] <= max_dist
+
+    def fuzzy_match(text: str, candidate: str, cutoff: float = 0.3) -> bool:
+        """
+        Similarity 2 * matches / (len(text) + len(candidate)) >= cutoff, case-insensitive, with
+        matches = longest common subsequence. LCS-based, so more permissive than difflib's ratio
+        (matching blocks) for garbled input, e.g. "6is0ni5" matches "seite" at 0.3.
+        """
+        if not text:
+            return False
+        total = len(text) + len(candidate)
+        return PageUtils.within_edit_distance(text.lower(), candidate.lower(), int((1 - cutoff) * total + 1e-9))
+
+    def fuzzy_contains(text: str, candidates: list[str], cutoff: float = 0.3) -> bool:
+        """
+        Return True if text is fuzzy-close to any candidate.
+        """
+        return any(PageUtils.fuzzy_match(text, cand, cutoff) for cand in candidates)
+
+    def parse_page_marker(text: str) -> Optional[Tuple[int, int]]:
+        """
+        Parse 'Seite X von Y' patterns with fuzzy closeness (cached, see PageMarkerParser).
+        """
+        return PAGE_MARKERS.parse(text)
+
+    def parse_page_markers(texts: Iterable[str]) -> List[Optional[Tuple[int, int]]]:
+        """
+        parse_page_marker for all footers of a document in one call (same order as texts).
+        """
+        return PAGE_MARKERS.parse_many(texts)
     
-    def page_plausibility_check(page_markers: Dict[int, int], pages_in_group: List[Dict[str, Any]]) -> Tuple[str, bool]:
+    def page_plausibility_check(page_markers: Dict[int, int], pages_in_group: List[Dict[str, Any]],
+                                blank_pages: Optional[List[int]] = None,
+                                duplicate_pages: Optional[List[List[int]]] = None) -> Tuple[str, bool]:
         """
         page_markers: dict mapping printed_page_number -> total_pages (from OCR text)
         pages_in_group: list of page dicts belonging to this student (each has 'page', the PDF page index)
+        blank_pages: PDF pages of the group skipped as blank (not counted as exam pages)
+        duplicate_pages: [[PDF page, earlier PDF page it looks like]] flagged by the page screening
         Return (check_message, is_ok)
         - If we have at least one printed total_pages (Y), we use the most common total_pages as expected.
         - Build set of printed page numbers seen (keys of page_markers) and compare to expected set.
         - If no markers found -> return ("No page markers found", False) or maybe True? we treat as OK=False to inform user.
         """
+        notes = []
+        if blank_pages:
+            notes.append(f"Skipped blank pages: {sorted(blank_pages)}")
+        if duplicate_pages:
+            notes.append("Possible duplicate scans: " + ", ".join(f"page {p} ~ page {q}" for p, q in duplicate_pages))
+
         if not page_markers:
-            return "No page markers found", False
+            return "; ".join(["No page markers found"] + notes), False
 
         # choose expected total as the most common 'total' value
         totals = list(page_markers.values())
@@ -69,7 +159,7 @@ class PageUtils:
 
         # Also check number of pages in the group vs expected_total
         # pages_in_group count might be different from len(seen_printed) if markers missing on some pages
-        actual_pages_count = len(pages_in_group)
+        actual_pages_count = len(pages_in_group) - len(set(blank_pages or []))
 
         messages = []
         ok = True
@@ -91,6 +181,9 @@ class PageUtils:
             ok = False
 
         if ok:
-            return "OK", True
+            return "; ".join(["OK"] + notes), True
         else:
-            return "; ".join(messages), False
+            return "; ".join(messages + notes), False
+
+
+PAGE_MARKERS = PageMarkerParser()
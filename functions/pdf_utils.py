@@ -1,28 +1,152 @@
-import zipfile
+from io import BytesIO
 from pathlib import Path
-from PIL import Image, ImageDraw
-from typing import List, Dict, Tuple, Any, Optional
+from PIL import Image
+from typing import List, Dict, Tuple, Optional
 import os
+import shutil
+import threading
+
+import numpy as np
+import pypdfium2 as pdfium
+
+from functions.metrics_utils import Metrics
+from functions.zip_utils import ZipUtils
+
+# PIL mode of a JPEG -> (PDF colour space, Decode array)
+_JPEG_COLORSPACES = {
+    "RGB": (b"/DeviceRGB", b""),
+    "L": (b"/DeviceGray", b""),
+    "CMYK": (b"/DeviceCMYK", b" /Decode [1 0 1 0 1 0 1 0]"),  # Adobe JPEGs store inverted CMYK
+}
+
+# PDFium is not thread-safe (not even across documents): every pdfium call of a process goes through this lock
+PDFIUM_LOCK = threading.Lock()
+
+
+def _jpeg_source(path: Path) -> Tuple[int, int, bytes, Optional[bytes]]:
+    """
+    (width, height, colour space + decode entries, in-memory data) of one page image.
+    Only the JPEG header is read; data is None when the file can be embedded as it is.
+    Anything that is not a plain JPEG is re-encoded (one page at a time).
+    """
+    with Image.open(path) as im:
+        width, height = im.size
+        if im.format == "JPEG" and im.mode in _JPEG_COLORSPACES:
+            colorspace, decode = _JPEG_COLORSPACES[im.mode]
+            return width, height, b"/ColorSpace " + colorspace + decode, None
+        buf = BytesIO()
+        im.convert("RGB").save(buf, format="JPEG", quality=90)
+    return width, height, b"/ColorSpace /DeviceRGB", buf.getvalue()
+
 
 class PdfUtils:
-    def save_annotated_pdf(pdf_folder: Path, out_name: str = "annotated_all.pdf") -> Optional[str]:
-        imgs: List[Image.Image] = []
+    def annotated_pages(pdf_folder: Path) -> List[Tuple[int, Path]]:
+        """(page number, detected.jpg) of every page that has an annotated image, in page order."""
         page_folders = sorted([p for p in pdf_folder.glob("image_*") if p.is_dir()],
                             key=lambda p: int(p.name.split("_")[1]))
-        for pf in page_folders:
-            det = pf / "detected.jpg"
-            if det.exists():
-                imgs.append(Image.open(det).convert("RGB"))
-        if not imgs:
+        return [(int(pf.name.split("_")[1]), pf / "detected.jpg") for pf in page_folders
+                if (pf / "detected.jpg").exists()]
+
+    def save_annotated_pdf(pdf_folder: Path, out_name: str = "annotated_all.pdf") -> Optional[str]:
+        pages = PdfUtils.annotated_pages(pdf_folder)
+        if not pages:
             return None
-        out_path = pdf_folder / out_name
-        imgs[0].save(out_path, save_all=True, append_images=imgs[1:])
+        return PdfUtils.write_jpeg_pdf([det for _, det in pages], pdf_folder / out_name)
+
+    def write_jpeg_pdf(image_paths: List[Path], out_path: Path, dpi: float = 72) -> Optional[str]:
+        """
+        One PDF page per JPEG, page size = image size at dpi (72 by default, same as PIL's PDF writer).
+        The JPEG files are embedded as DCTDecode streams, copied page by page without decoding
+        or re-encoding, so memory use does not grow with the number of pages.
+        """
+        if not image_paths:
+            return None
+        timer = Metrics.start("pdf_assembly", items=len(image_paths))
+        out_path = Path(out_path)
+        tmp = out_path.with_name(out_path.name + ".tmp")
+        offsets: Dict[int, int] = {}
+        kids: List[int] = []
+
+        with open(tmp, "wb") as f:
+            def begin(num: int):
+                offsets[num] = f.tell()
+                f.write(b"%d 0 obj\n" % num)
+
+            f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+            # 1 = catalog, 2 = page tree (written last, once all kids are known)
+            num = 3
+            for path in image_paths:
+                width, height, colorspace, data = _jpeg_source(Path(path))
+                length = len(data) if data is not None else os.path.getsize(path)
+                page_w, page_h = width * 72.0 / dpi, height * 72.0 / dpi
+                image_num, content_num, page_num = num, num + 1, num + 2
+                num += 3
+
+                begin(image_num)
+                f.write(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d %s /BitsPerComponent 8 "
+                        b"/Filter /DCTDecode /Length %d >>\nstream\n" % (width, height, colorspace, length))
+                if data is not None:
+                    f.write(data)
+                else:
+                    with open(path, "rb") as src:
+                        shutil.copyfileobj(src, f, 1 << 20)
+                f.write(b"\nendstream\nendobj\n")
+
+                content = b"q %g 0 0 %g 0 0 cm /Im0 Do Q" % (page_w, page_h)
+                begin(content_num)
+                f.write(b"<< /Length %d >>\nstream\n%s\nendstream\nendobj\n" % (len(content), content))
+
+                begin(page_num)
+                f.write(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %g %g] /Contents %d 0 R "
+                        b"/Resources << /XObject << /Im0 %d 0 R >> /ProcSet [/PDF /ImageC /ImageB] >> >>\nendobj\n"
+                        % (page_w, page_h, content_num, image_num))
+                kids.append(page_num)
+
+            begin(1)
+            f.write(b"<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+            begin(2)
+            f.write(b"<< /Type /Pages /Count %d /Kids [%s] >>\nendobj\n"
+                    % (len(kids), b" ".join(b"%d 0 R" % k for k in kids)))
+
+            xref = f.tell()
+            f.write(b"xref\n0 %d\n0000000000 65535 f \n" % num)
+            for i in range(1, num):
+                f.write(b"%010d 00000 n \n" % offsets[i])
+            f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (num, xref))
+
+        tmp.replace(out_path)
+        timer.stop()
+        return str(out_path)
+
+    def render_region(page, box: Tuple[float, float, float, float], scale: float) -> np.ndarray:
+        """
+        Render only box = (left, top, right, bottom) of a page, in PDF points from the top-left
+        corner of the page as displayed (rotation applied). BGR array, like a full page render.
+        """
+        left, top, right, bottom = box
+        with PDFIUM_LOCK, Metrics.stage("region_render", items=1):
+            width, height = page.get_size()
+            bitmap = page.render(scale=scale, crop=(left, height - bottom, width - right, top))
+            return bitmap.to_numpy().copy()
+
+    def extract_pages(src_pdf: Path, page_indices: List[int], out_path: Path) -> Optional[str]:
+        """
+        Copy pages (0-based indices) of an assembled PDF into a new PDF. The page objects and
+        their image streams are copied as they are, nothing is decoded.
+        """
+        if not page_indices:
+            return None
+        with PDFIUM_LOCK, Metrics.stage("pdf_assembly", items=len(page_indices)):
+            src = pdfium.PdfDocument(str(src_pdf))
+            dst = pdfium.PdfDocument.new()
+            try:
+                dst.import_pages(src, pages=list(page_indices))
+                dst.save(str(out_path))
+            finally:
+                dst.close()
+                src.close()
         return str(out_path)
+
     def make_zip_from_folder(folder: Path, zip_path: Path) -> str:
-        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-            for root, _, files in os.walk(folder):
-                for f in files:
-                    file_path = Path(root) / f
-                    arcname = file_path.relative_to(folder)
-                    zf.write(file_path, arcname)
-        return str(zip_path)
\ No newline at end of file
+        # already compressed members (pdf/xlsx/images) are stored, the rest deflated
+        return ZipUtils.write(ZipUtils.members_from_folder(folder), zip_path)
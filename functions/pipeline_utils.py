@@ -0,0 +1,830 @@
+from pathlib import Path
+import pypdfium2 as pdfium
+import os
+import math
+import multiprocessing
+import queue
+import threading
+import time
+from copy import deepcopy
+from contextvars import copy_context
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import cv2
+from typing import List, Dict, Any, Optional, Callable, Tuple, Iterator
+import numpy as np
+
+from functions import ocr  # <-- your YOLO+OCR wrapper
+from functions.chart_utils import ChartUtils
+from functions.cache_utils import CacheUtils
+from functions.config import (YOLO_BATCH_SIZE, IN_MEMORY_PIPELINE, DEBUG_ARTIFACTS, PAGE_WORKERS, PAGE_RANGE_SIZE,
+                              RENDER_SCALE, PAGE_CACHE_ENABLED, COMBINED_EXCEL_IMAGES, ARTIFACT_WORKERS,
+                              PIPELINED, PIPELINE_QUEUE_SIZE, PIPELINE_BATCH_WAIT, DETECT_SCALE, ROI_PADDING, PAGE_SCREENING, SCREEN_WIDTH)
+from functions.matnum_utils import MatNumUtils
+from functions.metrics_utils import JobMetrics, Metrics
+from functions.model_registry import ModelRegistry
+from functions.page_utils import PageUtils
+from functions.pdf_utils import PDFIUM_LOCK, PdfUtils
+from functions.preprocess_utils import PREPROCESS_PROFILES, PreprocessUtils
+from functions.question_utils import QuestionUtils
+from functions.screen_utils import ScreenUtils
+from functions.state_utils import StateUtils
+from functions.student_utils import StudentUtils
+from functions.yolo_detection import detection_params
+from functions.zip_utils import ZipUtils
+
+# Streaming download of the batch bundle (see routes/process_files.py)
+BUNDLE_URL = "/processing/jobs/{job_id}/bundle"
+
+
+def _no_progress(**fields):
+    pass
+
+
+# --------------------------
+# Process pool for page ranges (created on first use, shared by all jobs)
+# --------------------------
+_page_pool: Optional[ProcessPoolExecutor] = None
+_page_pool_profiles: Dict[str, Dict[str, Any]] = {}
+_page_pool_lock = threading.Lock()
+
+
+def _init_page_worker(threads_per_worker: int, profiles: Dict[str, Dict[str, Any]]):
+    # spawned workers only see the profiles registered at import time: take over the parent's
+    PREPROCESS_PROFILES.clear()
+    PREPROCESS_PROFILES.update(profiles)
+    # keep the workers from oversubscribing the cores with their own thread pools
+    cv2.setNumThreads(threads_per_worker)
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+    # load YOLO + docTR once for this worker
+    ModelRegistry.warm_up()
+
+
+def _process_page_range_in_worker(saved_pdf_path: str, pdf_folder: str, start: int,
+                                  stop: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    # stage timings of the worker go back with the pages and are merged into the job
+    with Metrics.job() as metrics:
+        pages = PipelineUtils.process_page_range(Path(saved_pdf_path), Path(pdf_folder), start, stop)
+    return pages, metrics.snapshot()
+
+
+def _get_page_pool() -> ProcessPoolExecutor:
+    global _page_pool, _page_pool_profiles
+    with _page_pool_lock:
+        if _page_pool is not None and _page_pool_profiles != PREPROCESS_PROFILES:
+            # a profile was registered since the workers started: running ranges finish on the old pool
+            _page_pool.shutdown(wait=False)
+            _page_pool = None
+        if _page_pool is None:
+            threads = max(1, (os.cpu_count() or 1) // PAGE_WORKERS)
+            _page_pool_profiles = deepcopy(PREPROCESS_PROFILES)
+            _page_pool = ProcessPoolExecutor(
+                max_workers=PAGE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),  # torch is not fork-safe
+                initializer=_init_page_worker,
+                initargs=(threads, _page_pool_profiles),
+            )
+        return _page_pool
+
+
+def _discard_page_pool(pool: ProcessPoolExecutor):
+    # a broken pool (worker died, initializer failed) never recovers: the next job builds a new one
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is pool:
+            _page_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --------------------------
+# Process pool for per-student PDF/Excel artifacts (no models needed in these workers)
+# --------------------------
+_artifact_pool: Optional[ProcessPoolExecutor] = None
+_artifact_pool_lock = threading.Lock()
+
+
+def _write_student_artifacts(graded: Dict[str, Any], page_folders: Optional[List[str]], student_folder: str,
+                             unique_id: str, grading_table=None, merged_pages: Optional[Tuple[str, List[int]]] = None) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    student_folder = Path(student_folder)
+    files = []
+    if page_folders is not None:
+        pdf_path = PipelineUtils.write_student_pdf(page_folders, student_folder, merged_pages)
+        if pdf_path:
+            files.append(str(pdf_path))
+    files.append(str(PipelineUtils.write_student_excel(graded, student_folder, unique_id, grading_table)))
+    # payload of the "export_written" job event
+    return {"name": student_folder.name, "files": files, "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def _write_student_artifacts_in_worker(*args) -> Dict[str, Any]:
+    # the stage timings of the worker travel back under "timings", to be merged into the job
+    with Metrics.job() as metrics:
+        event = _write_student_artifacts(*args)
+    event["timings"] = metrics.snapshot()
+    return event
+
+
+def _without_timings(event: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in event.items() if k != "timings"}
+
+
+def _get_artifact_pool() -> ProcessPoolExecutor:
+    global _artifact_pool
+    with _artifact_pool_lock:
+        if _artifact_pool is None:
+            _artifact_pool = ProcessPoolExecutor(
+                max_workers=ARTIFACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _artifact_pool
+
+
+# --------------------------
+# Pipelined mode: render -> YOLO+OCR -> grouping connected by bounded queues
+# --------------------------
+_END = object()  # end of a stage's output
+
+
+class _StageError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    # blocks while the queue is full (back-pressure), gives up once the consumer stopped
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event) -> Any:
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def _render_stage(saved_pdf_path: Path, pdf_folder: Path, n_pages: int, out_q: queue.Queue, stop: threading.Event,
+                  progress: Callable[..., None]):
+    try:
+        with PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(str(saved_pdf_path))
+        try:
+            cache_params = PipelineUtils._cache_params()
+            for i in range(n_pages):
+                if not _put(out_q, PipelineUtils._render_page(pdf, i, pdf_folder, cache_params, progress), stop):
+                    return
+        finally:
+            with PDFIUM_LOCK:
+                pdf.close()
+        _put(out_q, _END, stop)
+    except BaseException as e:
+        _put(out_q, _StageError(e), stop)
+
+
+def _detect_stage(saved_pdf_path: Path, in_q: queue.Queue, out_q: queue.Queue, stop: threading.Event,
+                  progress: Callable[..., None]):
+    pdf = None
+    try:
+        # own document handle for re-rendering the detected boxes (the render stage closes its one when done)
+        if DETECT_SCALE > 0:
+            with PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(str(saved_pdf_path))
+        batch_size = max(1, YOLO_BATCH_SIZE)
+        pending: List[Dict[str, Any]] = []
+        while True:
+            if pending:
+                # run a partial batch only once the render stage kept us waiting PIPELINE_BATCH_WAIT seconds
+                try:
+                    item = in_q.get(timeout=PIPELINE_BATCH_WAIT)
+                except queue.Empty:
+                    item = None
+            else:
+                item = _get(in_q, stop)
+            if item is _END or isinstance(item, _StageError):
+                for result in PipelineUtils._finish_pages(pending, progress, pdf):
+                    _put(out_q, result, stop)
+                _put(out_q, item, stop)
+                return
+            if item is not None:
+                pending.append(item)
+            misses = sum(1 for p in pending if p["cached"] is None)
+            # cached pages need no YOLO run; still bound the pages held here like a pipeline queue
+            if item is None or misses >= batch_size or len(pending) >= max(batch_size, PIPELINE_QUEUE_SIZE):
+                if stop.is_set():
+                    return
+                for result in PipelineUtils._finish_pages(pending, progress, pdf):
+                    if not _put(out_q, result, stop):
+                        return
+                pending = []
+    except BaseException as e:
+        _put(out_q, _StageError(e), stop)
+    finally:
+        if pdf is not None:
+            with PDFIUM_LOCK:
+                pdf.close()
+
+
+class PipelineUtils:
+    def run_pipeline(saved_pdf_path: Path, pdf_folder: Path, unique_id: str,
+                     progress: Optional[Callable[..., None]] = None,
+                     metrics: Optional[JobMetrics] = None) -> Dict[str, Any]:
+        """
+        Full processing of one uploaded exam PDF (render -> YOLO+OCR -> students -> Excel/PDF/ZIP).
+        Blocking; meant to run on a worker thread. progress(**fields) is called with
+        stage / pages_total / pages_done / students_total / students_done updates.
+        metrics: stage timings already taken for this job (upload); the breakdown is returned as "timings".
+        Returns the response payload of /processing/process-image/.
+        """
+        with Metrics.job(metrics):
+            return PipelineUtils._run_pipeline(saved_pdf_path, pdf_folder, unique_id, progress or _no_progress)
+
+    def _run_pipeline(saved_pdf_path: Path, pdf_folder: Path, unique_id: str,
+                      progress: Callable[..., None]) -> Dict[str, Any]:
+        # Convert PDF to images and run YOLO+OCR in batches of pages
+        with PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(str(saved_pdf_path))
+            n_pages = len(pdf)
+            pdf.close()
+        progress(stage="pages", pages_total=n_pages, pages_done=0)
+
+        pipelined = PIPELINED and not (PAGE_WORKERS > 1 and n_pages > 1)
+        if pipelined:
+            # pages stream in while later ones are still rendered / detected; each student is
+            # finished as soon as the next Mat_num page shows up
+            student_groups = MatNumUtils.iter_groups(ScreenUtils.flag_duplicates(
+                PipelineUtils.iter_pages_pipelined(saved_pdf_path, pdf_folder, n_pages, progress)))
+        else:
+            if PAGE_WORKERS > 1 and n_pages > 1:
+                pages_results = PipelineUtils.process_pages_in_pool(saved_pdf_path, pdf_folder, n_pages, progress)
+            else:
+                pages_results = PipelineUtils.process_page_range(saved_pdf_path, pdf_folder, 0, n_pages, progress)
+
+            # Split pages into students by Mat_num
+            pages_results = list(ScreenUtils.flag_duplicates(pages_results))
+            student_groups = MatNumUtils.split_pages_by_matnum(pages_results)
+            progress(stage="students", students_total=len(student_groups), students_done=0)
+
+        students_state: List[Dict[str, Any]] = []
+        graded_students: List[Dict[str, Any]] = []
+        per_student_folders: List[Path] = []
+        artifact_tasks: List[Tuple[Dict[str, Any], Optional[List[str]], Path]] = []
+        artifact_futures: List[Future] = []
+
+        # extract and grade each student group (cheap, in order)
+        for idx, pages in enumerate(student_groups):
+            t0 = time.perf_counter()
+            student_folder = pdf_folder / f"student_{idx+1}"
+            student_folder.mkdir(parents=True, exist_ok=True)
+
+            with Metrics.stage("extract_from_pages", items=len(pages)):
+                student_info, qmap, per_q_seen, page_markers = StudentUtils.extract_from_pages(pages)
+            student = StateUtils.student_state(student_info, qmap, per_q_seen, page_markers, pages)
+            graded = PipelineUtils.grade_student(student, pdf_folder)
+            progress(event="student_finalized", event_data=PipelineUtils._student_event(idx, graded, student, t0))
+
+            # collect
+            students_state.append(student)
+            graded_students.append(graded)
+            per_student_folders.append(student_folder)
+            task = (graded, [p.get("page_folder") for p in pages], student_folder, [p["page"] for p in pages])
+            if pipelined:
+                # per-student PDF + excel right away (PDF assembled from this student's page images)
+                fut = PipelineUtils.submit_student_artifacts(task, unique_id, progress=progress)
+                if fut is not None:
+                    artifact_futures.append(fut)
+                progress(students_done=idx + 1)
+            else:
+                artifact_tasks.append(task)
+
+        if pipelined:
+            for fut in artifact_futures:
+                Metrics.merge(fut.result()["timings"])
+            progress(stage="students", students_total=len(graded_students), students_done=len(graded_students))
+
+        # keep the extracted state so the batch can be regraded without vision
+        t0 = time.perf_counter()
+        state_path = StateUtils.save_state(pdf_folder, unique_id, students_state)
+        PipelineUtils._export_event(progress, "grading_state", state_path, t0)
+
+        # merged annotated PDF (all pages) first: the per-student PDFs are page ranges of it
+        t0 = time.perf_counter()
+        merged_pdf = PdfUtils.save_annotated_pdf(pdf_folder, out_name="annotated_all.pdf")
+        PipelineUtils._export_event(progress, "annotated_all_pdf", merged_pdf, t0)
+        merged_index = {page: i for i, (page, _) in enumerate(PdfUtils.annotated_pages(pdf_folder))} if merged_pdf else {}
+
+        # per-student annotated PDF + excel (with primus sheet included) - NO charts inside
+        if not pipelined:
+            PipelineUtils.write_student_artifacts(artifact_tasks, unique_id, progress=progress,
+                                                  merged_pdf=merged_pdf, merged_index=merged_index)
+
+        progress(stage="exports")
+        # combined Excel for all students
+        t0 = time.perf_counter()
+        combined_excel, bundle_path = PipelineUtils.write_batch_outputs(graded_students, per_student_folders, pdf_folder, unique_id)
+        PipelineUtils._export_event(progress, "combined_excel", combined_excel, t0)
+
+        return PipelineUtils._response("✅ Processing complete", pdf_folder, combined_excel, merged_pdf, bundle_path, graded_students,
+                                       students_state)
+
+    def regrade(pdf_folder: Path, unique_id: str, grading_table=None,
+                corrections: Optional[Dict[str, Dict[str, Optional[str]]]] = None) -> Dict[str, Any]:
+        """
+        Recompute marks, plausibility checks and the Excel/Primus exports of a processed batch
+        from its stored grading state (no rendering, YOLO or OCR).
+        corrections: {student_number (1-based): {qnum: raw grade}} - persisted for later regrades.
+        grading_table: persisted as well; None grades with the table of the last regrade that passed one.
+        """
+        with Metrics.job():
+            return PipelineUtils._regrade(pdf_folder, unique_id, grading_table, corrections)
+
+    def _regrade(pdf_folder: Path, unique_id: str, grading_table,
+                 corrections: Optional[Dict[str, Dict[str, Optional[str]]]]) -> Dict[str, Any]:
+        state = StateUtils.load_state(pdf_folder)
+        if state is None:
+            raise FileNotFoundError(f"No grading state in {pdf_folder}")
+        students = state["students"]
+        new_table = grading_table is not None
+        if not new_table:
+            grading_table = state.get("grading_table")
+
+        if corrections:
+            for student_no, per_q in corrections.items():
+                idx = int(student_no) - 1
+                if not 0 <= idx < len(students):
+                    raise ValueError(f"Unknown student number: {student_no}")
+                StateUtils.apply_corrections(students[idx], per_q)
+        if corrections or new_table:
+            StateUtils.save_state(pdf_folder, unique_id, students, grading_table)
+
+        graded_students: List[Dict[str, Any]] = []
+        per_student_folders: List[Path] = []
+        for idx, student in enumerate(students):
+            student_folder = pdf_folder / f"student_{idx+1}"
+            student_folder.mkdir(parents=True, exist_ok=True)
+            graded_students.append(PipelineUtils.grade_student(student, pdf_folder, grading_table))
+            per_student_folders.append(student_folder)
+        # annotated PDFs do not depend on the marks and are kept as they are
+        PipelineUtils.write_student_artifacts(
+            [(graded, None, folder, []) for graded, folder in zip(graded_students, per_student_folders)],
+            unique_id, grading_table)
+
+        merged = pdf_folder / "annotated_all.pdf"
+        merged_pdf = str(merged) if merged.exists() else None
+        combined_excel, bundle_path = PipelineUtils.write_batch_outputs(graded_students, per_student_folders, pdf_folder, unique_id, grading_table)
+
+        return PipelineUtils._response("✅ Regrading complete", pdf_folder, combined_excel, merged_pdf, bundle_path, graded_students,
+                                       students)
+
+    def grade_student(student: Dict[str, Any], pdf_folder: Path, grading_table=None) -> Dict[str, Any]:
+        """
+        Marks and plausibility checks for one student state (see StateUtils.student_state).
+        Returns {"row", "norm_flags", "numeric", "qmap", "per_q_seen", "issues"}.
+        """
+        qmap, per_q_seen = student["qmap"], student["per_q_seen"]
+        pages = [{"page": p} for p in student["pages"]]
+        page_check_msg, page_ok = PageUtils.page_plausibility_check(student["page_markers"], pages,
+                                                                    student.get("blank_pages"),
+                                                                    student.get("duplicate_pages"))
+
+        # build student row
+        row, norm_flags, numeric_achieved = StudentUtils.build_student_row_and_flags(
+            student["student_info"], qmap, pdf_folder, page_check_msg, grading_table)
+        # compute and attach totals/percent/mark already done in build_student_row_and_flags
+
+        issues, per_q_status = QuestionUtils.run_plausibility_checks(qmap, numeric_achieved, per_q_seen)
+        # append page-related plausibility issue to issues
+        if not page_ok:
+            issues.append(f"Page check: {page_check_msg}")
+
+        return {
+            "row": row,
+            "norm_flags": norm_flags,
+            "numeric": numeric_achieved,
+            "qmap": qmap,
+            "per_q_seen": per_q_seen,
+            "issues": {"issues": issues, "per_q_status": per_q_status, "page_check": page_check_msg},
+        }
+
+    def write_student_artifacts(tasks: List[Tuple[Dict[str, Any], Optional[List[str]], Path, List[int]]], unique_id: str,
+                                grading_table=None, progress: Optional[Callable[..., None]] = None,
+                                merged_pdf: Optional[str] = None, merged_index: Optional[Dict[int, int]] = None):
+        """
+        Write the per-student outputs for tasks [(graded, page_folders or None, student_folder, page numbers)]:
+        annotated_student.pdf (skipped when page_folders is None) and student_result.xlsx.
+        merged_pdf / merged_index (page number -> page index in merged_pdf): the student PDFs are
+        copied out of the merged annotated PDF instead of being assembled from the page images again.
+        Students are independent, so with EXAM_ARTIFACT_WORKERS > 1 they are fanned out to a process pool.
+        Returns once every student is written; the first failure is raised.
+        """
+        progress = progress or _no_progress
+        merged_index = merged_index or {}
+        args = []
+        for graded, page_folders, folder, page_nums in tasks:
+            indices = [merged_index[n] for n in page_nums if n in merged_index]
+            merged_pages = (merged_pdf, indices) if merged_pdf and indices else None
+            args.append((graded, page_folders, str(folder), unique_id, grading_table, merged_pages))
+
+        if ARTIFACT_WORKERS > 1 and len(args) > 1:
+            pool = _get_artifact_pool()
+            futures = [pool.submit(_write_student_artifacts_in_worker, *a) for a in args]
+            for done, fut in enumerate(as_completed(futures), start=1):
+                Metrics.merge(fut.result()["timings"])
+                progress(event="export_written", event_data=_without_timings(fut.result()))
+                progress(students_done=done)
+            return
+
+        for done, a in enumerate(args, start=1):
+            progress(event="export_written", event_data=_write_student_artifacts(*a))
+            progress(students_done=done)
+
+    def submit_student_artifacts(task: Tuple[Dict[str, Any], Optional[List[str]], Path, List[int]], unique_id: str,
+                                 grading_table=None, progress: Optional[Callable[..., None]] = None) -> Optional[Future]:
+        """
+        Write the outputs of one student (see write_student_artifacts) without waiting for the rest:
+        on the artifact pool when EXAM_ARTIFACT_WORKERS > 1 (returns the future, whose result carries
+        the worker's stage timings under "timings" for the caller to merge), otherwise inline.
+        """
+        progress = progress or _no_progress
+        graded, page_folders, folder, _ = task
+        args = (graded, page_folders, str(folder), unique_id, grading_table, None)
+        if ARTIFACT_WORKERS > 1:
+            def report(f: Future):
+                if f.exception() is None:
+                    progress(event="export_written", event_data=_without_timings(f.result()))
+
+            fut = _get_artifact_pool().submit(_write_student_artifacts_in_worker, *args)
+            fut.add_done_callback(report)
+            return fut
+        progress(event="export_written", event_data=_write_student_artifacts(*args))
+        return None
+
+    def write_student_pdf(page_folders: List[str], student_folder: Path,
+                          merged_pages: Optional[Tuple[str, List[int]]] = None) -> Optional[str]:
+        """
+        annotated_student.pdf: the student's pages of the merged annotated PDF (merged_pages =
+        (merged_pdf, page indices)), otherwise assembled from the page.jpg images.
+        """
+        student_pdf_path = student_folder / "annotated_student.pdf"
+        if merged_pages:
+            return PdfUtils.extract_pages(Path(merged_pages[0]), merged_pages[1], student_pdf_path)
+        # detected.jpg pages for this group; fallback: page.jpg
+        imgs = [Path(pf) / "detected.jpg" for pf in page_folders if (Path(pf) / "detected.jpg").exists()]
+        if not imgs:
+            imgs = [Path(pf) / "page.jpg" for pf in page_folders if (Path(pf) / "page.jpg").exists()]
+        return PdfUtils.write_jpeg_pdf(imgs, student_pdf_path)
+
+    def write_student_excel(graded: Dict[str, Any], student_folder: Path, unique_id: str, grading_table=None) -> Path:
+        per_excel = student_folder / "student_result.xlsx"
+        StudentUtils.save_students_excel_and_primus([graded["row"]], [graded["norm_flags"]], [graded["numeric"]],
+                                                    [graded["qmap"]], [graded["per_q_seen"]], per_excel, unique_id, grading_table)
+        return per_excel
+
+    def write_batch_outputs(graded_students: List[Dict[str, Any]], per_student_folders: List[Path], pdf_folder: Path,
+                            unique_id: str, grading_table=None) -> Tuple[Path, Optional[str]]:
+        """
+        Combined Excel for all students, plus (for batches) the grade chart.
+        The ZIP bundle is not written to disk; it is streamed by the bundle download endpoint.
+        Returns (combined_excel, bundle download URL or None).
+        """
+        students_rows = [g["row"] for g in graded_students]
+        combined_excel = pdf_folder / "all_students_results.xlsx"
+        StudentUtils.save_students_excel_and_primus(students_rows, [g["norm_flags"] for g in graded_students],
+                                                    [g["numeric"] for g in graded_students], [g["qmap"] for g in graded_students],
+                                                    [g["per_q_seen"] for g in graded_students], combined_excel, unique_id, grading_table,
+                                                    embed_images=COMBINED_EXCEL_IMAGES)
+
+        # if multiple students -> one ZIP bundle with ONLY the overall grade chart inside
+        bundle_path: Optional[str] = None
+        if len(per_student_folders) > 1:
+            # create grade distribution chart
+            chart_path = pdf_folder / "grade_distribution.png"
+            ChartUtils.generate_grade_distribution_chart(students_rows, chart_path)
+            bundle_path = BUNDLE_URL.format(job_id=unique_id)
+
+        return combined_excel, bundle_path
+
+    def bundle_members(pdf_folder: Path) -> List[Tuple[str, Path]]:
+        """
+        (arcname, path) of the batch bundle: every student_N folder plus the grade chart at the root.
+        Empty for single-student jobs.
+        """
+        student_folders = sorted([p for p in pdf_folder.glob("student_*") if p.is_dir()],
+                                 key=lambda p: int(p.name.split("_")[1]))
+        if len(student_folders) < 2:
+            return []
+        members: List[Tuple[str, Path]] = []
+        for sf in student_folders:
+            members.extend(ZipUtils.members_from_folder(sf, prefix=f"{sf.name}/"))
+        chart = pdf_folder / "grade_distribution.png"
+        if chart.exists():
+            members.append((chart.name, chart))
+        return members
+
+    def _student_event(idx: int, graded: Dict[str, Any], student: Dict[str, Any], t0: float) -> Dict[str, Any]:
+        """Payload of the "student_finalized" job event (the student's summary row)."""
+        row = graded["row"]
+        return {
+            "student": idx + 1,
+            "pages": student["pages"],
+            "matriculation_number": row.get("Matriculation Number"),
+            "seat_number": row.get("Seat Number"),
+            "total": row.get("Total_Achieved"),
+            "max_total": row.get("Max_Total"),
+            "percent": row.get("Percent"),
+            "final_mark": row.get("Final_Mark"),
+            "issues": graded["issues"]["issues"],
+            "low_confidence_boxes": len(student.get("low_confidence", [])),
+            "seconds": round(time.perf_counter() - t0, 3),
+        }
+
+    def _export_event(progress: Callable[..., None], name: str, path, t0: float):
+        if path:
+            progress(event="export_written", event_data={"name": name, "files": [str(path)],
+                                                         "seconds": round(time.perf_counter() - t0, 3)})
+
+    def _response(message: str, pdf_folder: Path, combined_excel: Path, merged_pdf: Optional[str],
+                  bundle_path: Optional[str], graded_students: List[Dict[str, Any]],
+                  students_state: List[Dict[str, Any]]) -> Dict[str, Any]:
+        metrics = Metrics.current()
+        low_confidence: Dict[str, int] = {}
+        for student in students_state:
+            for box in student.get("low_confidence", []):
+                low_confidence[box["label"]] = low_confidence.get(box["label"], 0) + 1
+        return {
+            "message": message,
+            "output_dir": str(pdf_folder),
+            "combined_excel": str(combined_excel),
+            "annotated_all_pdf": merged_pdf,
+            "zip_if_batch": bundle_path,
+            "students_count": len(graded_students),
+            "students_issues": [g["issues"] for g in graded_students],
+            # YOLO boxes below their label's confidence threshold (not OCRed): total, per label, per student
+            "low_confidence_boxes": {
+                "total": sum(low_confidence.values()),
+                "by_label": low_confidence,
+                "per_student": [s.get("low_confidence", []) for s in students_state],
+            },
+            # per-stage wall/CPU seconds, item counts and peak RSS of this job
+            "timings": metrics.snapshot() if metrics else None,
+        }
+
+    def process_page_range(saved_pdf_path: Path, pdf_folder: Path, start: int, stop: int,
+                           progress: Optional[Callable[..., None]] = None) -> List[Dict[str, Any]]:
+        """
+        Render PDF pages [start, stop) (0-based) and run YOLO+OCR on them in batches.
+        Pages found in the page cache (same rendered content, models and parameters) skip YOLO+OCR.
+        Returns one page result per page ({"results", "page", "page_folder", ...}), in page order.
+        """
+        progress = progress or _no_progress
+        with PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(str(saved_pdf_path))
+        pages_results: List[Dict[str, Any]] = []
+        batch_size = max(1, YOLO_BATCH_SIZE)
+        cache_params = PipelineUtils._cache_params()
+
+        # rendered pages since the last YOLO+OCR batch (cache hits are passed through in order)
+        pending: List[Dict[str, Any]] = []
+
+        def flush():
+            if not pending:
+                return
+            pages_results.extend(PipelineUtils._finish_pages(pending, progress, pdf))
+            pending.clear()
+            progress(pages_done=len(pages_results))
+
+        for i in range(start, stop):
+            pending.append(PipelineUtils._render_page(pdf, i, pdf_folder, cache_params, progress))
+            if sum(1 for p in pending if p["cached"] is None) >= batch_size:
+                flush()
+
+        flush()
+        with PDFIUM_LOCK:
+            pdf.close()
+        pages_results.sort(key=lambda p: p["page"])
+        return pages_results
+
+    def iter_pages_pipelined(saved_pdf_path: Path, pdf_folder: Path, n_pages: int,
+                             progress: Optional[Callable[..., None]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Same page results as process_page_range(0, n_pages), yielded in page order as soon as each
+        page is done. Rendering and YOLO+OCR run on their own threads, connected by queues of
+        EXAM_PIPELINE_QUEUE_SIZE pages, so only a bounded number of rendered pages is held in memory
+        and the caller can group / grade students while later pages are still processed.
+        Stage errors are re-raised here; closing the generator early stops the stages.
+        """
+        progress = progress or _no_progress
+        rendered: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        finished: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        stop = threading.Event()
+        # each stage runs in a copy of this context: its stage timings count for the current job
+        threads = [
+            threading.Thread(target=copy_context().run,
+                             args=(_render_stage, saved_pdf_path, pdf_folder, n_pages, rendered, stop, progress),
+                             name="pipeline-render", daemon=True),
+            threading.Thread(target=copy_context().run,
+                             args=(_detect_stage, saved_pdf_path, rendered, finished, stop, progress),
+                             name="pipeline-detect", daemon=True),
+        ]
+        for t in threads:
+            t.start()
+
+        pages_done = 0
+        try:
+            while True:
+                item = _get(finished, stop)
+                if item is _END:
+                    return
+                if isinstance(item, _StageError):
+                    raise item.error
+                pages_done += 1
+                progress(pages_done=pages_done)
+                yield item
+        finally:
+            stop.set()
+            for t in threads:
+                t.join()
+
+    def _cache_params() -> Dict[str, Any]:
+        return {
+            "render_scale": RENDER_SCALE,
+            "detect_scale": DETECT_SCALE,
+            "roi_padding": ROI_PADDING if DETECT_SCALE > 0 else None,
+            "preprocess": PreprocessUtils.cache_params(),
+            "detection": detection_params(),
+            "artifacts": (not IN_MEMORY_PIPELINE) or DEBUG_ARTIFACTS,
+        }
+
+    def _render_page(pdf, i: int, pdf_folder: Path, cache_params: Dict[str, Any],
+                     progress: Callable[..., None] = _no_progress) -> Dict[str, Any]:
+        """
+        Render page i (0-based) and look it up in the page cache. In two-resolution mode
+        (EXAM_DETECT_SCALE > 0) the page is rendered at the detection scale only.
+        With EXAM_PAGE_SCREENING the render is screened first (ScreenUtils.screen): a blank page gets
+        its (empty) page result right away and is neither cached nor detected; in single-resolution
+        mode the screen uses a small render and the RENDER_SCALE render is only made for non-blank pages.
+        Returns {"page", "page_folder", "image", "image_path", "key", "screen", "blank",
+        "cached" (page result or None)}.
+        """
+        t0 = time.perf_counter()
+        page_num = i + 1
+        page_folder = pdf_folder / f"image_{page_num}"
+        page_folder.mkdir(parents=True, exist_ok=True)
+
+        full_scale = DETECT_SCALE if DETECT_SCALE > 0 else RENDER_SCALE
+        with PDFIUM_LOCK, Metrics.stage("page_render", items=1):
+            page = pdf[i]
+            scale = full_scale
+            if PAGE_SCREENING and DETECT_SCALE <= 0:
+                scale = min(full_scale, SCREEN_WIDTH / page.get_width())
+            bitmap = page.render(scale=scale)
+            image = bitmap.to_numpy().copy()  # BGR, as cv2 would read it
+
+        screen = None
+        if PAGE_SCREENING:
+            with Metrics.stage("page_screen", items=1):
+                screen = ScreenUtils.screen(image)
+            if screen["blank"]:
+                progress(event="page_rendered", event_data={"page": page_num, "seconds": round(time.perf_counter() - t0, 3),
+                                                            "cached": False, "blank": True})
+                return {
+                    "page": page_num,
+                    "page_folder": page_folder,
+                    "image": None,
+                    "image_path": None,
+                    "key": None,
+                    "screen": screen,
+                    "blank": True,
+                    "cached": ScreenUtils.blank_result(page_num, str(page_folder), screen),
+                }
+            if scale != full_scale:
+                with PDFIUM_LOCK, Metrics.stage("page_render", items=0):
+                    image = pdf[i].render(scale=full_scale).to_numpy().copy()
+
+        page_image_path = None
+        if not IN_MEMORY_PIPELINE or DEBUG_ARTIFACTS:
+            page_image_path = page_folder / "page.jpg"
+            with Metrics.stage("jpeg_save", items=1):
+                cv2.imwrite(str(page_image_path), image)
+
+        key = CacheUtils.page_key(image, cache_params) if PAGE_CACHE_ENABLED else None
+        cached = CacheUtils.load(key, page_folder, page_num) if key else None
+        if cached is not None:
+            cached.update({
+                "original": str(page_image_path) if page_image_path else None,
+                "page": page_num,
+                "page_folder": str(page_folder),
+                "screen": screen,
+            })
+        progress(event="page_rendered", event_data={"page": page_num, "seconds": round(time.perf_counter() - t0, 3),
+                                                    "cached": cached is not None, "blank": False})
+        return {
+            "page": page_num,
+            "page_folder": page_folder,
+            "image": image,
+            "image_path": str(page_image_path) if page_image_path else None,
+            "key": key,
+            "screen": screen,
+            "blank": False,
+            "cached": cached,
+        }
+
+    def _region_renderer(pdf, i: int) -> Callable[[Tuple[int, int, int, int]], Tuple[np.ndarray, List[int]]]:
+        """
+        Re-renders boxes of page i found on its DETECT_SCALE render at RENDER_SCALE:
+        box in detection pixels -> (crop, box in RENDER_SCALE pixels, as if the whole page was rendered).
+        """
+        with PDFIUM_LOCK:
+            page = pdf[i]
+            width, height = page.get_size()
+
+        def render(box: Tuple[int, int, int, int]) -> Tuple[np.ndarray, List[int]]:
+            x1, y1, x2, y2 = box
+            # widen the box to whole RENDER_SCALE pixels so the crop lines up with a full page render
+            x = math.floor(max(0.0, x1 / DETECT_SCALE - ROI_PADDING) * RENDER_SCALE)
+            y = math.floor(max(0.0, y1 / DETECT_SCALE - ROI_PADDING) * RENDER_SCALE)
+            right = min(width, math.ceil((x2 / DETECT_SCALE + ROI_PADDING) * RENDER_SCALE) / RENDER_SCALE)
+            bottom = min(height, math.ceil((y2 / DETECT_SCALE + ROI_PADDING) * RENDER_SCALE) / RENDER_SCALE)
+            crop = PdfUtils.render_region(page, (x / RENDER_SCALE, y / RENDER_SCALE, right, bottom), RENDER_SCALE)
+            return crop, [x, y, x + crop.shape[1], y + crop.shape[0]]
+
+        return render
+
+    def _finish_pages(rendered: List[Dict[str, Any]],
+                      progress: Callable[..., None] = _no_progress, pdf=None) -> List[Dict[str, Any]]:
+        """
+        Run YOLO+OCR in one batch on the rendered pages missing from the cache; page results in input order.
+        pdf: open document of the pages, needed in two-resolution mode to re-render the detected boxes.
+        Emits page_detected / page_ocr events (seconds = the page's share of the batch time).
+        """
+        misses = [r for r in rendered if r["cached"] is None]
+        missed = {r["page"] for r in misses}
+        timings: Dict[str, float] = {}
+        if misses:
+            # call your YOLO+OCR wrapper - returns one dict with "results" list per page
+            regions = None
+            if DETECT_SCALE > 0:
+                regions = [PipelineUtils._region_renderer(pdf, r["page"] - 1) for r in misses]
+            batch_results = ocr.process_and_ocr_images([r["image"] for r in misses], [r["page_folder"] for r in misses],
+                                                       image_paths=[r["image_path"] for r in misses], timings=timings,
+                                                       regions=regions, pages=[r["page"] for r in misses])
+            for r, result in zip(misses, batch_results):
+                if r["key"]:
+                    CacheUtils.store(r["key"], result, r["page_folder"])
+                result.update({"page": r["page"], "page_folder": str(r["page_folder"]), "screen": r["screen"]})
+                r["cached"] = result
+        for stage, event in (("detect", "page_detected"), ("ocr", "page_ocr")):
+            share = round(timings.get(stage, 0.0) / max(1, len(misses)), 3)
+            for r in rendered:
+                miss = r["page"] in missed
+                progress(event=event, event_data={"page": r["page"], "seconds": share if miss else 0.0,
+                                                  "cached": not miss and not r["blank"], "blank": r["blank"],
+                                                  "batch_pages": len(misses)})
+        return [r["cached"] for r in rendered]
+
+    def process_pages_in_pool(saved_pdf_path: Path, pdf_folder: Path, n_pages: int,
+                              progress: Optional[Callable[..., None]] = None) -> List[Dict[str, Any]]:
+        """
+        Split the PDF into page ranges and run process_page_range on the shared process pool
+        (one set of YOLO/docTR models per worker). Results are merged back in page order.
+        """
+        progress = progress or _no_progress
+        pool = _get_page_pool()
+        range_size = max(1, min(PAGE_RANGE_SIZE, math.ceil(n_pages / PAGE_WORKERS)))
+        futures: List[Future] = []
+        pages_results: List[Dict[str, Any]] = []
+        try:
+            for start in range(0, n_pages, range_size):
+                futures.append(pool.submit(_process_page_range_in_worker, str(saved_pdf_path), str(pdf_folder),
+                                           start, min(start + range_size, n_pages)))
+
+            for fut in as_completed(futures):
+                range_results, timings = fut.result()
+                Metrics.merge(timings)
+                pages_results.extend(range_results)
+                progress(pages_done=len(pages_results))
+                # the workers cannot report per page; their pages are announced once the range is back
+                for page in range_results:
+                    progress(event="page_ocr", event_data={"page": page["page"]})
+        except BrokenProcessPool:
+            _discard_page_pool(pool)
+            raise
+        except BaseException:
+            # one range failed: the job fails, do not keep the workers busy with its other ranges
+            for fut in futures:
+                fut.cancel()
+            raise
+
+        pages_results.sort(key=lambda p: p["page"])
+        return pages_results
@@ -0,0 +1,71 @@
+from typing import Any, Dict, Optional, Tuple
+import cv2
+import numpy as np
+
+# OCR crop preprocessing (also part of the page cache key)
+PREPROCESS_PARAMS = {
+    "blur_ksize": 3,
+    "block_size": 15,
+    "c": 11,
+    "upscale_below": 200,  # crops whose longer side is smaller are upscaled 2x
+}
+
+# Per-label overrides of PREPROCESS_PARAMS, e.g. {"grades": {"c": 9}, "Mat_num": {"upscale_below": 0}}
+PREPROCESS_PROFILES: Dict[str, Dict[str, Any]] = {}
+
+
+class PreprocessUtils:
+    def register_profile(label: str, **overrides):
+        """Use other preprocessing settings for the crops of one YOLO label (merged over PREPROCESS_PARAMS)."""
+        unknown = set(overrides) - set(PREPROCESS_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown preprocessing parameters: {sorted(unknown)}")
+        PREPROCESS_PROFILES.setdefault(label, {}).update(overrides)
+
+    def params_for(label: Optional[str]) -> Dict[str, Any]:
+        return {**PREPROCESS_PARAMS, **PREPROCESS_PROFILES.get(label, {})}
+
+    def cache_params() -> Dict[str, Any]:
+        return {"default": PREPROCESS_PARAMS, "labels": PREPROCESS_PROFILES, "engine": "page"}
+
+    def binarize(gray: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+        """Blur + adaptive mean threshold of a grayscale image, returned as 3-channel (BGR = RGB) array."""
+        k = params["blur_ksize"]
+        blurred = cv2.GaussianBlur(gray, (k, k), 0)
+        th = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY,
+                                   params["block_size"], params["c"])
+        return cv2.cvtColor(th, cv2.COLOR_GRAY2BGR)
+
+    def upscale_if_small(crop: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+        h, w = crop.shape[:2]
+        if max(h, w) < params["upscale_below"]:
+            return cv2.resize(crop, (w * 2, h * 2), interpolation=cv2.INTER_CUBIC)
+        return crop
+
+    def preprocess_crop(crop: np.ndarray, label: Optional[str] = None) -> np.ndarray:
+        """Preprocess a single BGR crop for OCR (used when there is no page to slice from)."""
+        params = PreprocessUtils.params_for(label)
+        th = PreprocessUtils.binarize(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), params)
+        return PreprocessUtils.upscale_if_small(th, params)
+
+
+class PagePreprocessor:
+    """
+    Preprocesses all crops of one page in a single pass: the page is converted to grayscale once
+    and blurred + thresholded once per distinct label profile; crops are slices (views) of that
+    binarized page, only crops below upscale_below are copied (upscaled).
+    The grayscale page is taken at construction, so boxes drawn on the page afterwards do not leak into crops.
+    """
+
+    def __init__(self, page: np.ndarray):
+        self.gray = cv2.cvtColor(page, cv2.COLOR_BGR2GRAY)
+        self._binarized: Dict[Tuple[int, int, int], np.ndarray] = {}
+
+    def crop(self, box: Tuple[int, int, int, int], label: Optional[str] = None) -> np.ndarray:
+        params = PreprocessUtils.params_for(label)
+        key = (params["blur_ksize"], params["block_size"], params["c"])
+        page = self._binarized.get(key)
+        if page is None:
+            page = self._binarized[key] = PreprocessUtils.binarize(self.gray, params)
+        x1, y1, x2, y2 = box
+        return PreprocessUtils.upscale_if_small(page[y1:y2, x1:x2], params)
@@ -0,0 +1,73 @@
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+import cv2
+import numpy as np
+
+from functions.config import (BLANK_INK_RATIO, BLANK_INK_DELTA, DUPLICATE_WINDOW, DUPLICATE_MAX_DISTANCE,
+                              SCREEN_WIDTH)
+
+# dHash size: HASH_SIZE x HASH_SIZE bits
+HASH_SIZE = 16
+
+
+class ScreenUtils:
+    def screen(image: np.ndarray) -> Dict[str, Any]:
+        """
+        Cheap look at a rendered page (BGR, any scale) before YOLO/OCR, on a SCREEN_WIDTH wide grayscale copy.
+        Returns {"blank": bool, "ink_ratio": float, "hash": hex dHash}.
+        Ink = pixels clearly darker than the page background (median), a margin of 4% is ignored
+        (scanner borders, punch holes).
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        h, w = gray.shape
+        small = cv2.resize(gray, (SCREEN_WIDTH, max(1, round(h * SCREEN_WIDTH / w))), interpolation=cv2.INTER_AREA)
+
+        m = int(min(small.shape) * 0.04)
+        inner = small[m:small.shape[0] - m, m:small.shape[1] - m]
+        background = float(np.median(inner))
+        ink_ratio = float(np.count_nonzero(inner < background - BLANK_INK_DELTA)) / max(1, inner.size)
+
+        # difference hash: is each pixel brighter than its right neighbour
+        thumb = cv2.resize(small, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+        bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+        value = int("".join("1" if b else "0" for b in bits), 2)
+        return {
+            "blank": ink_ratio < BLANK_INK_RATIO,
+            "ink_ratio": round(ink_ratio, 6),
+            "hash": f"{value:0{HASH_SIZE * HASH_SIZE // 4}x}",
+        }
+
+    def hash_distance(a: str, b: str) -> int:
+        """Number of differing bits of two screen hashes."""
+        return (int(a, 16) ^ int(b, 16)).bit_count()
+
+    def flag_duplicates(pages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Pass page results through in order, setting page["duplicate_of"] (earlier page number) when the
+        page's screen hash is within DUPLICATE_MAX_DISTANCE bits of one of the DUPLICATE_WINDOW
+        previous non-blank pages (double feeds, rescans). Blank and unscreened pages are not compared.
+        """
+        recent: List[Tuple[int, str]] = []
+        for page in pages:
+            screen = page.get("screen")
+            if screen and not screen["blank"] and DUPLICATE_WINDOW > 0:
+                for other, other_hash in reversed(recent):
+                    if ScreenUtils.hash_distance(screen["hash"], other_hash) <= DUPLICATE_MAX_DISTANCE:
+                        page["duplicate_of"] = other
+                        break
+                recent.append((page["page"], screen["hash"]))
+                del recent[:-DUPLICATE_WINDOW]
+            yield page
+
+    def blank_result(page_num: int, page_folder: str, screen: Dict[str, Any]) -> Dict[str, Any]:
+        """Page result of a skipped blank page: no image files, no detections."""
+        return {
+            "original": None,
+            "detected_image": None,
+            "cropped_folder": None,
+            "results": [],
+            "low_confidence": [],
+            "page": page_num,
+            "page_folder": page_folder,
+            "blank": True,
+            "screen": screen,
+        }
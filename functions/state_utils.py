@@ -0,0 +1,68 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+STATE_FILE = "grading_state.json"
+
+
+class StateUtils:
+    """
+    Persist what StudentUtils.extract_from_pages produced for every student of a batch,
+    so marks and spreadsheets can be recomputed later without re-running YOLO/OCR.
+    Stored as <pdf_folder>/grading_state.json:
+        {"unique_id", "grading_table", "students": [{"student_info", "qmap", "per_q_seen", "page_markers", "pages",
+                                                     "low_confidence", "blank_pages", "duplicate_pages"}]}
+    grading_table: the table of the last regrade that passed one (None: DEFAULT_GRADING_TABLE).
+    """
+
+    def student_state(student_info: Dict[str, Any], qmap: Dict[str, Any], per_q_seen: Dict[str, int],
+                      page_markers: Dict[int, int], pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "student_info": student_info,
+            "qmap": qmap,
+            "per_q_seen": per_q_seen,
+            "page_markers": page_markers,
+            "pages": [p["page"] for p in pages],
+            # skipped YOLO boxes: {"page", "label", "conf", "bbox"}
+            "low_confidence": [dict(box, page=p["page"]) for p in pages for box in p.get("low_confidence", [])],
+            # pages skipped by the screening / flagged as possible duplicate scans: [[page, duplicate_of]]
+            "blank_pages": [p["page"] for p in pages if p.get("blank")],
+            "duplicate_pages": [[p["page"], p["duplicate_of"]] for p in pages if p.get("duplicate_of")],
+        }
+
+    def save_state(pdf_folder: Path, unique_id: str, students: List[Dict[str, Any]], grading_table=None) -> str:
+        path = Path(pdf_folder) / STATE_FILE
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            # crop paths (Path objects) are stored as strings
+            json.dump({"unique_id": unique_id, "grading_table": grading_table, "students": students}, f, default=str,
+                      separators=(",", ":"))
+        tmp.replace(path)
+        return str(path)
+
+    def load_state(pdf_folder: Path) -> Optional[Dict[str, Any]]:
+        path = Path(pdf_folder) / STATE_FILE
+        if not path.exists():
+            return None
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        for student in state["students"]:
+            # JSON object keys are strings; page markers map int -> int
+            student["page_markers"] = {int(k): v for k, v in student["page_markers"].items()}
+        return state
+
+    def apply_corrections(student: Dict[str, Any], corrections: Dict[str, Optional[str]]):
+        """
+        Manual grade corrections {qnum: raw grade string}. A corrected question counts as seen
+        exactly once (resolves no_match / double_match); None clears the grade.
+        """
+        for qnum, raw in corrections.items():
+            qnum = str(qnum)
+            entry = student["qmap"].setdefault(qnum, {
+                "raw": None, "raw_conf": None, "max_marks": None, "page": None,
+                "achieved_page": None, "q_crop": None, "g_crop": None,
+            })
+            entry["raw"] = raw
+            entry["raw_conf"] = 1.0 if raw is not None else None
+            entry["corrected"] = True
+            student["per_q_seen"][qnum] = 1 if raw is not None else 0
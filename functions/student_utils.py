@@ -6,7 +6,7 @@ from openpyxl.styles import PatternFill
 from functions.question_utils import QuestionUtils
 from functions.page_utils import PageUtils
 from functions.ocr_post_utils import OCRPostUtils
-from functions.grade_utils import GradeUtils
+from functions.grade_utils import GradeUtils, DEFAULT_GRADING_TABLE, COLORS
 from functions.excel_utils import ExcelUtils
 from functions.chart_utils import ChartUtils
 from openpyxl import load_workbook, Workbook
@@ -14,6 +14,9 @@ from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
 from openpyxl.drawing.image import Image as XLImage
 import re
 from openpyxl.formatting.rule import CellIsRule, FormulaRule
+from openpyxl.cell import WriteOnlyCell
+from functions.config import STREAMING_EXCEL, EXCEL_THUMBNAILS
+from functions.metrics_utils import Metrics
 
 OUTPUT_DIR = Path("processed_results")
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -35,28 +38,21 @@ class StudentUtils:
         questions = []
         grades = []
         page_markers: Dict[int, int] = {}
+        footers: List[str] = []
 
         for page in pages:
             page_num = page["page"]
-            for item in page.get("results", []):
-                label = item.get("label")
-                ocr_output = item.get("text")  # list of (text, conf)
-                bbox = item.get("bbox", [0, 0, 0, 0])
-                path = item.get("path")
-                # print("path is ",path)
-                # path = item.get("path") 
-                # print(path) # path from YOLO detection
-
-                if not ocr_output:
+            for item in page.get("results", []):  # Detection records
+                label = item.label
+                bbox = item.bbox
+
+                if item.text is None:
                     continue
 
-                best_text, best_conf = max(ocr_output, key=lambda x: x[1])
+                best_text, best_conf = item.text, item.conf
 
                 if label == "page_number":
-                    pm = PageUtils.parse_page_marker(best_text)
-                    if pm:
-                        printed_cur, printed_total = pm
-                        page_markers[printed_cur] = printed_total
+                    footers.append(best_text)
 
                 elif label == "Mat_num":
                     student_info["Mat_num"] = best_text.split(":")[-1].strip()
@@ -72,7 +68,7 @@ class StudentUtils:
                             "max_marks": max_marks,
                             "page": page_num,
                             "y": bbox[1],
-                            "q_crop": item.get("raw_path"),   # keep actual crop
+                            "q_crop": item.raw_path,   # keep actual crop
                         })
                     
 
@@ -82,42 +78,79 @@ class StudentUtils:
                         "conf": best_conf,
                         "page": page_num,
                         "y": (bbox[1] + bbox[3]) / 2,
-                        "g_crop": item.get("raw_path"),   # keep actual crop
+                        "g_crop": item.raw_path,   # keep actual crop
                     })
                 
 
-        # sort questions
-        questions.sort(key=lambda q: (q["page"], q["y"]))
+        for pm in PageUtils.parse_page_markers(footers):
+            if pm:
+                printed_cur, printed_total = pm
+                page_markers[printed_cur] = printed_total
+
+        qmap, per_q_seen = StudentUtils.assign_grades_to_questions(questions, grades)
+
+        # Ensure missing question numbers are also included
+        if qmap:
+            max_q = max(int(k) for k in qmap.keys())
+            for qid in range(1, max_q + 1):
+                qid_str = str(qid)
+                if qid_str not in qmap:
+                    qmap[qid_str] = {
+                        "raw": None,
+                        "raw_conf": None,
+                        "max_marks": None,
+                        "page": None,
+                        "achieved_page": None,
+                        "q_crop": None,
+                        "g_crop": None,
+                        "error": "YOLO failed to detect"
+                    }
+
 
-        qmap = {}
-        per_q_seen = {}
+        return student_info, qmap, per_q_seen, page_markers
+
+    def assign_grades_to_questions(questions: List[Dict[str, Any]],
+                                   grades: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """
+        Give every question the grades between its headline and the next question's headline in
+        reading order ((page, y), next question exclusive; the last question runs to the end).
+        questions: {"qnum", "max_marks", "page", "y", "q_crop"}; grades: {"text", "conf", "page", "y", "g_crop"}.
+        Returns (qmap, per_q_seen): the most confident grade per question and the number of candidates.
+        Sweep over both lists sorted by (page, y): O((Q + G) log(Q + G)) instead of scanning all grades per question.
+        """
+        questions = sorted(questions, key=lambda q: (q["page"], q["y"]))
+        # grades in reading order; the original index keeps the first of equally confident grades winning
+        order = sorted(range(len(grades)), key=lambda k: (grades[k]["page"], grades[k]["y"]))
+
+        qmap: Dict[str, Any] = {}
+        per_q_seen: Dict[str, int] = {}
+        pos = 0
+        if questions:
+            # grades above the first question belong to none
+            first = (questions[0]["page"], questions[0]["y"])
+            while pos < len(order) and (grades[order[pos]]["page"], grades[order[pos]]["y"]) < first:
+                pos += 1
 
         for i, q in enumerate(questions):
             qnum = q["qnum"]
-            max_marks = q["max_marks"]
-            page_start, y_start = q["page"], q["y"]
-
             if i + 1 < len(questions):
-                page_end, y_end = questions[i + 1]["page"], questions[i + 1]["y"]
+                end = (questions[i + 1]["page"], questions[i + 1]["y"])
             else:
-                page_end, y_end = float("inf"), float("inf")
-
-            # candidate grades between this question and the next one
-            candidate_grades = []
-            for g in grades:
-                if (g["page"] > page_start or (g["page"] == page_start and g["y"] >= y_start)) and \
-                (g["page"] < page_end or (g["page"] == page_end and g["y"] < y_end)):
-                    candidate_grades.append(g)
+                end = (float("inf"), float("inf"))
 
-            per_q_seen[qnum] = len(candidate_grades)
+            start = pos
+            while pos < len(order) and (grades[order[pos]]["page"], grades[order[pos]]["y"]) < end:
+                pos += 1
+            candidates = order[start:pos]
 
-            if candidate_grades:
-                best_grade = max(candidate_grades, key=lambda g: g["conf"])
+            per_q_seen[qnum] = len(candidates)
+            if candidates:
+                best_grade = grades[max(candidates, key=lambda k: (grades[k]["conf"], -k))]
                 qmap[qnum] = {
                     "raw": best_grade["text"],
                     "raw_conf": best_grade["conf"],
-                    "max_marks": max_marks,
-                    "page": page_start,
+                    "max_marks": q["max_marks"],
+                    "page": q["page"],
                     "achieved_page": best_grade["page"],
                     "q_crop": q.get("q_crop"),
                     "g_crop": best_grade.get("g_crop"),
@@ -126,37 +159,20 @@ class StudentUtils:
                 qmap[qnum] = {
                     "raw": None,
                     "raw_conf": None,
-                    "max_marks": max_marks,
-                    "page": page_start,
+                    "max_marks": q["max_marks"],
+                    "page": q["page"],
                     "achieved_page": None,
                     "q_crop": q.get("q_crop"),
                     "g_crop": None,
                 }
-                    # Ensure missing question numbers are also included
-        if qmap:
-            max_q = max(int(k) for k in qmap.keys())
-            for qid in range(1, max_q + 1):
-                qid_str = str(qid)
-                if qid_str not in qmap:
-                    qmap[qid_str] = {
-                        "raw": None,
-                        "raw_conf": None,
-                        "max_marks": None,
-                        "page": None,
-                        "achieved_page": None,
-                        "q_crop": None,
-                        "g_crop": None,
-                        "error": "YOLO failed to detect"
-                    }
-
-
-        return student_info, qmap, per_q_seen, page_markers
+        return qmap, per_q_seen
 
     def build_student_row_and_flags(student_info: Dict[str, Any], qmap: Dict[str, Any], base_output_dir: Path,
-                                    page_check_msg: str) -> Tuple[Dict[str, Any], Dict[str, bool], Dict[str, Optional[float]]]:
+                                    page_check_msg: str, grading_table=None) -> Tuple[Dict[str, Any], Dict[str, bool], Dict[str, Optional[float]]]:
         """
         Returns (row, normalized_flags, numeric_achieved_per_q)
         Row includes Page_Check, Max_Total, Total_Achieved, Percent, Final_Mark
+        grading_table: [(min_percent, mark)], defaults to GradeUtils' table
         Note: This function still produces a wide 'row' (legacy), but the combined excel creation now uses a pivoted layout.
         """
         def format_number_de(val: Optional[float], decimals: int = 2) -> str:
@@ -211,7 +227,7 @@ class StudentUtils:
         row["Total_Achieved"] = format_number_de(total, 1)  # one digit after separator
         row["Max_Total"] = format_number_de(max_total, 0)
         row["Percent"] = format_number_de((total / max_total * 100) if max_total else 0.0, 1).replace(".", ",")
-        row["Final_Mark"] = GradeUtils.map_percentage_to_mark((total / max_total * 100) if max_total else 0.0).replace(".", ",")
+        row["Final_Mark"] = GradeUtils.map_percentage_to_mark((total / max_total * 100) if max_total else 0.0, grading_table).replace(".", ",")
         row["Page_Check"] = page_check_msg
 
         return row, normalized_flags, numeric_achieved
@@ -224,39 +240,22 @@ class StudentUtils:
         students_qmap_list: List[Dict[str, Any]],
         students_per_q_seen: List[Dict[str, int]],
         output_path: Path,
-        unique_id: str
+        unique_id: str,
+        grading_table=None,
+        streaming: bool = STREAMING_EXCEL,
+        embed_images: bool = True
     ):
-        DEFAULT_GRADING_TABLE = [
-            (0,  "5,0"),
-            (50, "4,0"),
-            (55, "3,7"),
-            (60, "3,3"),
-            (65, "3,0"),
-            (70, "2,7"),
-            (75, "2,3"),
-            (80, "2,0"),
-            (85, "1,7"),
-            (90, "1,3"),
-            (95, "1,0"),
-        ]
-
-        # Colors (hex without alpha for openpyxl)
-        COLORS = {
-            "full":        "C6EFCE",  # light green
-            "zero":        "C00000",  # deep red (changed from FFC7CE)
-            "no_match":    "EE82EE",  # violet
-            "double_match":"800080",  # purple
-            "invalid":     "FFA07A",  # orange-like for invalid/plausibility
-            "normalized":  "FFA500",  # orange for normalized (distinct)
-            "page_error":  "D3D3D3"   # light gray for page plausibility error
-        }
+        """
+        embed_images=False keeps the workbook image-free: the Question_Image / Achieved_Image
+        cells link to the crop files instead.
+        """
+        if streaming:
+            return StudentUtils.save_students_excel_and_primus_streaming(
+                students_rows, students_normalized_flags, students_numeric_per_q, students_qmap_list,
+                students_per_q_seen, output_path, unique_id, grading_table, embed_images)
+        timer = Metrics.start("excel_write", items=len(students_rows))
+        grading_rows = grading_table if grading_table is not None else DEFAULT_GRADING_TABLE
 
-        # Font color overrides for readability
-        FONT_COLORS = {
-            "double_match": "FFFFFF",  # white on purple
-            "zero": "FFFFFF"  # white on deep red
-        }
-    
         wb = Workbook()
         if "Sheet" in wb.sheetnames:
             wb.remove(wb["Sheet"])
@@ -326,6 +325,7 @@ class StudentUtils:
             #     cell.fill = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
 
         images_to_embed: List[Tuple[str, str]] = []
+        primus_ids: List[Tuple[str, str]] = []  # normalized (mat, seat) per student for Primus_Export
         current_row = table_start_row + 1
 
         # Fill rows, one row per question instance (same as before but adapted to new columns)
@@ -346,6 +346,7 @@ class StudentUtils:
             mat=mat_norm
             seat_norm = str(seat_norm).strip() if seat_norm is not None else ""
             seat=seat_norm
+            primus_ids.append((mat, seat))
 
             # Step 2: write to Question Overview
             mat_cell = ws.cell(row=current_row, column=1, value=mat_norm)
@@ -408,10 +409,14 @@ class StudentUtils:
                 ws.cell(row=current_row, column=5, value=q_page).alignment = Alignment(horizontal="center", vertical="center")
 
                 # Question_Image (F)
+                q_link = ""
                 if q_crop and Path(q_crop).exists():
-                    images_to_embed.append((f"F{current_row}", q_crop))
+                    if embed_images:
+                        images_to_embed.append((f"F{current_row}", q_crop))
+                    else:
+                        q_link = ExcelUtils.make_clickable_link(q_crop, "Open Crop")
                 # place a text label for image presence (keeps cell non-empty; embedding done later)
-                ws.cell(row=current_row, column=6, value="").alignment = Alignment(horizontal="center", vertical="center")
+                ws.cell(row=current_row, column=6, value=q_link).alignment = Alignment(horizontal="center", vertical="center")
 
                 # Achieved (numeric)
     # Achieved (numeric)
@@ -440,9 +445,13 @@ class StudentUtils:
                 ws.cell(row=current_row, column=9, value=achieved_page or "").alignment = Alignment(horizontal="center", vertical="center")
 
                 # Grade_Image (I)
+                g_link = ""
                 if g_crop and Path(g_crop).exists():
-                    images_to_embed.append((f"H{current_row}", g_crop))
-                ws.cell(row=current_row, column=8, value="").alignment = Alignment(horizontal="center", vertical="center")
+                    if embed_images:
+                        images_to_embed.append((f"H{current_row}", g_crop))
+                    else:
+                        g_link = ExcelUtils.make_clickable_link(g_crop, "Open Crop")
+                ws.cell(row=current_row, column=8, value=g_link).alignment = Alignment(horizontal="center", vertical="center")
 
                 # Achieved_Relative (%) formula -> =IF(Drow=0,"",Grow/Drow)
                 # Put as formula; format as percentage with one decimal place.
@@ -469,6 +478,9 @@ class StudentUtils:
                 # Full_Page_Link (L)
                 # Build a link to the detected page if available; otherwise link to page image name.
                 page_file = OUTPUT_DIR / unique_id / f"image_{achieved_page or q_page}" / "page.jpg"
+                if not page_file.exists():
+                    # in-memory pipeline keeps only the annotated page on disk
+                    page_file = page_file.with_name("detected.jpg")
                 link_formula = ExcelUtils.make_clickable_link(page_file, "Open Page")
                 ws.cell(row=current_row, column=12, value=link_formula).alignment = Alignment(horizontal="center", vertical="center")
                 current_row += 1
@@ -503,49 +515,14 @@ class StudentUtils:
             pass
 
         # Embed images (question crops into F, grade crops into I)
-        from openpyxl.drawing.spreadsheet_drawing import OneCellAnchor, AnchorMarker
-        from openpyxl.drawing.xdr import XDRPositiveSize2D
-        from openpyxl.utils import column_index_from_string
-
         for coord, path in images_to_embed:
-            try:
-                img = XLImage(path)
-                max_width, max_height = 120, 90
-                ratio = min(max_width / img.width, max_height / img.height)
-                img.width = int(img.width * ratio)
-                img.height = int(img.height * ratio)
-
-                # --- calculate offsets for centering ---
-                col_letters = re.sub(r"\d+", "", coord)
-                row_num = int(re.sub(r"[A-Z]+", "", coord))
-                col_num = column_index_from_string(col_letters)
-
-                col_width = ws.column_dimensions[col_letters].width or 10
-                # Excel column width to pixels (approx factor ~7)
-                cell_w = int(col_width * 7)
-                cell_h = int(ws.row_dimensions[row_num].height or 70)
-
-                offset_x = max((cell_w - img.width) // 2, 0)
-                offset_y = max((cell_h - img.height) // 2, 0)
-
-                # --- build proper anchor with size ---
-                marker = AnchorMarker(col=col_num - 1, colOff=offset_x * 9525,
-                                    row=row_num - 1, rowOff=offset_y * 9525)
-                ext = XDRPositiveSize2D(img.width * 9525, img.height * 9525)
-                anchor = OneCellAnchor(_from=marker, ext=ext)
-
-                img.anchor = anchor
-                ws.add_image(img)
-
-                # lock row height so images don’t overlap
-                ws.row_dimensions[row_num].height = cell_h
-
-            except Exception as e:
-                print(f"Image embedding failed for {path}: {e}")
+            StudentUtils.embed_image(ws, coord, path)
 
 
         # Save workbook to output_path (Question Overview done)
         wb.save(output_path)
+        timer.stop()
+        timer = Metrics.start("primus_write", items=len(students_rows))
 
     
     # --------------------------
@@ -572,7 +549,7 @@ class StudentUtils:
         primus.cell(row=legend_start_row, column=1, value="Grading Table").font = Font(bold=True)
 
         r = legend_start_row + 1
-        for bound, grade in DEFAULT_GRADING_TABLE:
+        for bound, grade in grading_rows:
             primus.cell(row=r, column=1, value=bound)
             primus.cell(row=r, column=2, value=grade)
             primus.cell(row=r, column=1).number_format = "0"
@@ -626,7 +603,7 @@ class StudentUtils:
         grading_table_end = r - 1
         grading_range = f"$A${grading_table_start}:$B${grading_table_end}"  # dynamic range
 
-        for row_dict in students_rows:
+        for mat, seat in primus_ids:
             primus.cell(row=rownum, column=1, value=mat)
             primus.cell(row=rownum, column=2, value=seat)
             
@@ -709,9 +686,358 @@ class StudentUtils:
             pass
 
         wb2.save(output_path)
+        if images_to_embed:
+            ExcelUtils.dedupe_media(output_path)
+        timer.stop()
+
+    def embed_image(ws, coord: str, path: str):
+        """
+        Anchor the crop at path into cell coord, scaled into a 120x90 box and centered in the cell.
+        The row height must already be final (write-only sheets) or is locked here (normal sheets).
+        """
+        from openpyxl.drawing.spreadsheet_drawing import OneCellAnchor, AnchorMarker
+        from openpyxl.drawing.xdr import XDRPositiveSize2D
+        from openpyxl.utils import column_index_from_string
+
+        try:
+            img = ExcelUtils.thumbnail(path) if EXCEL_THUMBNAILS else XLImage(path)
+            max_width, max_height = 120, 90
+            ratio = min(max_width / img.width, max_height / img.height)
+            img.width = int(img.width * ratio)
+            img.height = int(img.height * ratio)
+
+            # --- calculate offsets for centering ---
+            col_letters = re.sub(r"\d+", "", coord)
+            row_num = int(re.sub(r"[A-Z]+", "", coord))
+            col_num = column_index_from_string(col_letters)
+
+            col_width = ws.column_dimensions[col_letters].width or 10
+            # Excel column width to pixels (approx factor ~7)
+            cell_w = int(col_width * 7)
+            cell_h = int(ws.row_dimensions[row_num].height or 70)
+
+            offset_x = max((cell_w - img.width) // 2, 0)
+            offset_y = max((cell_h - img.height) // 2, 0)
+
+            # --- build proper anchor with size ---
+            marker = AnchorMarker(col=col_num - 1, colOff=offset_x * 9525,
+                                row=row_num - 1, rowOff=offset_y * 9525)
+            ext = XDRPositiveSize2D(img.width * 9525, img.height * 9525)
+            anchor = OneCellAnchor(_from=marker, ext=ext)
+
+            img.anchor = anchor
+            ws.add_image(img)
+
+            # lock row height so images don’t overlap
+            ws.row_dimensions[row_num].height = cell_h
+
+        except Exception as e:
+            print(f"Image embedding failed for {path}: {e}")
+
+    def save_students_excel_and_primus_streaming(
+        students_rows: List[Dict[str, Any]],
+        students_normalized_flags: List[Dict[str, bool]],
+        students_numeric_per_q: List[Dict[str, Optional[float]]],
+        students_qmap_list: List[Dict[str, Any]],
+        students_per_q_seen: List[Dict[str, int]],
+        output_path: Path,
+        unique_id: str,
+        grading_table=None,
+        embed_images: bool = True
+    ):
+        """
+        Same workbook as save_students_excel_and_primus (Question Overview + Primus_Export, same
+        formatting, formulas and conditional formatting), written in one pass with write-only
+        worksheets: rows are streamed out as they are built and the file is never reloaded.
+        Write-only rows are final once appended, so each row is assembled as {column: cell spec} first.
+        """
+        timer = Metrics.start("excel_write", items=len(students_rows))
+        grading_rows = grading_table if grading_table is not None else DEFAULT_GRADING_TABLE
+        thin = Side(border_style="thin", color="000000")
+        border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        center = Alignment(horizontal="center", vertical="center")
+        bold = Font(bold=True)
+
+        def solid(color: str) -> PatternFill:
+            return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+        def emit(sheet, specs: Dict[int, Dict[str, Any]]):
+            # specs: {column: {"value", "font", "fill", "border", "alignment", "number_format"}}
+            row = [None] * (max(specs) if specs else 0)
+            for col, spec in specs.items():
+                c = WriteOnlyCell(sheet, value=spec.get("value"))
+                for attr in ("font", "fill", "border", "alignment", "number_format"):
+                    if spec.get(attr) is not None:
+                        setattr(c, attr, spec[attr])
+                row[col - 1] = c
+            sheet.append(row)
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title="Question Overview")
+        primus = wb.create_sheet(title="Primus_Export")
+
+        # Column widths must be set before the first row is streamed
+        for col, w in zip("ABCDEFGHIJKL", [20, 15, 12, 12, 12, 25, 15, 25, 15, 18, 28, 22]):
+            ws.column_dimensions[col].width = w
+        for col, w in zip("ABCDEFG", [20, 15, 18, 18, 18, 14, 22]):
+            primus.column_dimensions[col].width = w
+
+        # ------------------------------
+        # Question Overview: legends
+        # ------------------------------
+        marks_legend = [
+            ("full points", COLORS["full"]),
+            ("zero", COLORS["zero"]),
+            ("no match found", COLORS["no_match"]),
+            ("double match found", COLORS["double_match"]),
+            ("normalized (OCR correction)", COLORS["normalized"]),
+        ]
+        errors_legend = [
+            ("page plausibility error", COLORS["page_error"]),
+            ("invalid / plausibility", COLORS["invalid"]),
+        ]
+        start_row = 1
+        table_start_row = start_row + max(len(marks_legend), len(errors_legend)) + 2
+        legend: Dict[int, Dict[int, Dict[str, Any]]] = {r: {} for r in range(start_row, table_start_row)}
+        legend[start_row][1] = {"value": "Marks Legend", "font": bold}
+        legend[start_row][4] = {"value": "Errors Legend", "font": bold}
+        for i, (label, color) in enumerate(marks_legend):
+            white = color.upper() in [COLORS["double_match"].upper(), COLORS["zero"].upper()]
+            legend[start_row + 1 + i][1] = {"value": label, "border": border}
+            legend[start_row + 1 + i][2] = {"value": "", "fill": solid(color), "border": border,
+                                            "font": Font(color="FFFFFF") if white else None}
+        for i, (label, color) in enumerate(errors_legend):
+            legend[start_row + 1 + i][4] = {"value": label, "border": border}
+            legend[start_row + 1 + i][5] = {"value": "", "fill": solid(color), "border": border}
+        for r in range(start_row, table_start_row):
+            emit(ws, legend[r])
+
+        # ------------------------------
+        # Question Overview: table
+        # ------------------------------
+        headers = [
+            "Matriculation Number",
+            "Seat Number",
+            "Question",
+            "Q_Max",
+            "Q_Page",
+            "Question_Image",
+            "Achieved",
+            "Achieved_Image",
+            "Achieved_Page",
+            "Achieved_Relative (%)",
+            "Error_Check",
+            "Full_Page_Link",
+        ]
+        # the table gets borders only if it has at least one data row
+        has_rows = any(students_qmap_list)
+        emit(ws, {ci: {"value": h, "font": bold, "alignment": center, "border": border if has_rows else None}
+                  for ci, h in enumerate(headers, start=1)})
 
+        images_to_embed: List[Tuple[str, str]] = []
+        primus_ids: List[Tuple[str, str]] = []
+        current_row = table_start_row + 1
+        pending: Dict[int, Dict[str, Any]] = {}  # cells of current_row written before its question
 
+        for row_dict, numeric_vals, qmap, per_q_seen, norm_flags in zip(
+            students_rows, students_numeric_per_q, students_qmap_list, students_per_q_seen, students_normalized_flags
+        ):
+            mat = row_dict.get("Matriculation Number")
+            seat = row_dict.get("Seat Number")
+            mat_norm, mat_changed = OCRPostUtils.normalize_digits(mat) if mat else (mat, False)
+            seat_norm, seat_changed = OCRPostUtils.normalize_digits(seat) if seat else (seat, False)
+            mat = str(mat_norm).strip() if mat_norm is not None else ""
+            seat = str(seat_norm).strip() if seat_norm is not None else ""
+            primus_ids.append((mat, seat))
+
+            for col, value, changed in ((1, mat, mat_changed), (2, seat, seat_changed)):
+                spec = pending.setdefault(col, {})
+                spec["value"] = value
+                if changed:
+                    spec["fill"] = solid(COLORS["normalized"])
+                elif OCRPostUtils.classify_id_field(value) != "full":  # invalid
+                    spec["fill"] = solid(COLORS["invalid"])
 
+            for qnum in sorted(qmap.keys(), key=lambda x: int(x)):
+                entry = qmap[qnum]
+                max_marks = entry.get("max_marks")
+                q_page = entry.get("page")
+                achieved_page = entry.get("achieved_page")
+                q_crop = entry.get("q_crop")
+                g_crop = entry.get("g_crop")
+                achieved_num = numeric_vals.get(qnum)
 
+                # Plausibility message
+                status = QuestionUtils.classify_question_status(achieved_num, max_marks, per_q_seen.get(qnum, 0))
+                if status == "no_match":
+                    ec_msg = f"{qnum}: no grade detected"
+                elif status == "double_match":
+                    ec_msg = f"{qnum}: multiple grades detected ({per_q_seen[qnum]})"
+                elif status == "invalid":
+                    ec_msg = f"{qnum}: invalid achieved ({achieved_num}) vs max {max_marks}"
+                else:
+                    ec_msg = "OK"
 
+                specs = pending
+                pending = {}
+                specs.setdefault(1, {}).update({"value": mat, "alignment": center})
+                specs.setdefault(2, {}).update({"value": seat, "alignment": center})
+                specs[3] = {"value": qnum, "alignment": center}
 
+                # Q_Max (numeric if present)
+                if max_marks is not None:
+                    try:
+                        specs[4] = {"value": float(max_marks), "number_format": "#,##0.0", "alignment": center}
+                    except Exception:
+                        specs[4] = {"value": str(max_marks)}
+                else:
+                    specs[4] = {"value": "", "alignment": center}
+                specs[5] = {"value": q_page, "alignment": center}
+
+                # Question_Image (F) / Achieved_Image (H)
+                for col, letter, crop in ((6, "F", q_crop), (8, "H", g_crop)):
+                    value = ""
+                    if crop and Path(crop).exists():
+                        if embed_images:
+                            images_to_embed.append((f"{letter}{current_row}", crop))
+                        else:
+                            value = ExcelUtils.make_clickable_link(crop, "Open Crop")
+                    specs[col] = {"value": value, "alignment": center}
+
+                # Achieved (numeric) with status color
+                achieved = {"value": float(achieved_num) if achieved_num is not None else "", "alignment": center}
+                if achieved_num is not None:
+                    achieved["number_format"] = "#,##0.0"
+                if status in ("full", "zero", "no_match", "double_match"):
+                    achieved["fill"] = solid(COLORS[status])
+                elif norm_flags.get(qnum, False):  # normalized OCR correction
+                    achieved["fill"] = solid(COLORS["normalized"])
+                specs[7] = achieved
+
+                specs[9] = {"value": achieved_page or "", "alignment": center}
+                specs[10] = {"value": f'=IF(D{current_row}=0,"",G{current_row}/D{current_row})',
+                             "number_format": "0.0%", "alignment": center}
+
+                # Error_Check
+                err = {"value": ec_msg, "alignment": center}
+                if ec_msg == "OK":
+                    err["fill"] = solid("C6EFCE")  # green
+                elif "no grade detected" in ec_msg:
+                    err["fill"] = solid(COLORS["no_match"])
+                elif "multiple grades detected" in ec_msg:
+                    err["fill"] = solid(COLORS["double_match"])
+                elif "invalid achieved" in ec_msg:
+                    err["fill"] = solid(COLORS["invalid"])
+                elif "page" in ec_msg.lower():  # plausibility or page error
+                    err["fill"] = solid(COLORS["page_error"])
+                specs[11] = err
+
+                # Full_Page_Link (L)
+                page_file = OUTPUT_DIR / unique_id / f"image_{achieved_page or q_page}" / "page.jpg"
+                if not page_file.exists():
+                    # in-memory pipeline keeps only the annotated page on disk
+                    page_file = page_file.with_name("detected.jpg")
+                specs[12] = {"value": ExcelUtils.make_clickable_link(page_file, "Open Page"), "alignment": center}
+
+                for spec in specs.values():
+                    spec["border"] = border
+                if images_to_embed and images_to_embed[-1][0][1:] == str(current_row):
+                    ws.row_dimensions[current_row].height = 70
+                emit(ws, specs)
+                current_row += 1
+
+        if pending:
+            # last student without any question: its id cells stay below the table
+            emit(ws, pending)
+
+        table_end_row = current_row - 1
+        if table_end_row >= table_start_row + 1:
+            ws.auto_filter.ref = f"A{table_start_row}:L{table_end_row}"
+
+        for coord, path in images_to_embed:
+            StudentUtils.embed_image(ws, coord, path)
+        timer.stop()
+
+        # --------------------------
+        # Primus_Export sheet with German grading system
+        # --------------------------
+        timer = Metrics.start("primus_write", items=len(students_rows))
+        legend_start_row = 1
+        r = legend_start_row + 1 + len(grading_rows)
+        rows: Dict[int, Dict[int, Dict[str, Any]]] = {i: {} for i in range(legend_start_row, r + 2)}
+        rows[legend_start_row][1] = {"value": "Grading Table", "font": bold, "border": border, "alignment": center}
+        rows[legend_start_row][2] = {"border": border, "alignment": center}
+        for i, (bound, grade) in enumerate(grading_rows):
+            rows[legend_start_row + 1 + i][1] = {"value": bound, "number_format": "0", "border": border, "alignment": center}
+            rows[legend_start_row + 1 + i][2] = {"value": grade, "border": border, "alignment": center}
+
+        # Pass/Fail legend
+        rows[legend_start_row][4] = {"value": "Legend", "font": bold}
+        rows.setdefault(legend_start_row + 1, {}).update({
+            4: {"value": "Pass (<5,0)", "border": border},
+            5: {"value": "", "fill": solid("C6EFCE"), "border": border},
+        })
+        rows.setdefault(legend_start_row + 2, {}).update({
+            4: {"value": "Fail (=5,0)", "border": border},
+            5: {"value": "", "fill": solid("C00000"), "border": border},
+        })
+        header_row = r + 2  # leave some space after grading table + legend
+        for i in range(legend_start_row, header_row):
+            emit(primus, rows.get(i, {}))
+
+        primus_headers = [
+            "Matriculation Number",
+            "Seat Number",
+            "Achieved Marks",
+            "Maximum Marks",
+            "Percentage",
+            "Final Mark",
+            "Error Checking"
+        ]
+        emit(primus, {ci: {"value": h, "font": bold, "border": border, "alignment": center}
+                      for ci, h in enumerate(primus_headers, start=1)})
+
+        grading_range = f"$A${legend_start_row + 1}:$B${r - 1}"  # dynamic range
+        rownum = header_row + 1
+        for mat, seat in primus_ids:
+            cells = {
+                1: {"value": mat},
+                2: {"value": seat},
+                # Achieved / Maximum Marks
+                3: {"value": f"=SUMIFS('Question Overview'!G:G,'Question Overview'!A:A,A{rownum},'Question Overview'!B:B,B{rownum})",
+                    "number_format": "#,##0.0"},
+                4: {"value": f"=SUMIFS('Question Overview'!D:D,'Question Overview'!A:A,A{rownum},'Question Overview'!B:B,B{rownum})",
+                    "number_format": "#,##0.0"},
+                5: {"value": f"=IF(D{rownum}=0,0,C{rownum}/D{rownum})", "number_format": "0.0%"},
+                # Final Mark using German grading system
+                6: {"value": f"=VLOOKUP(E{rownum}*100,{grading_range},2,TRUE)", "number_format": "0.0"},
+                7: {"value": f'=IF(OR(C{rownum}<0,C{rownum}>D{rownum}),"Range Error","OK")'},
+            }
+            for spec in cells.values():
+                spec.update({"border": border, "alignment": center})
+            emit(primus, cells)
+            rownum += 1
+
+        primus.auto_filter.ref = f"A{header_row}:G{rownum-1}"
+
+        # Conditional Formatting (Error Checking + Final Mark pass/fail)
+        ok_rule = FormulaRule(formula=['INDIRECT("G"&ROW())="OK"'], fill=solid("C6EFCE"))
+        bad_rule = FormulaRule(formula=['INDIRECT("G"&ROW())<>"OK"'], fill=solid("C00000"))
+        primus.conditional_formatting.add(f"F{header_row+1}:G{rownum-1}", ok_rule)
+        primus.conditional_formatting.add(f"F{header_row+1}:G{rownum-1}", bad_rule)
+        primus.conditional_formatting.add(
+            f"F{header_row+1}:F{rownum-1}",
+            CellIsRule(operator="equal", formula=['"5,0"'], fill=solid("C00000"))  # Fail
+        )
+        primus.conditional_formatting.add(
+            f"F{header_row+1}:F{rownum-1}",
+            CellIsRule(operator="lessThan", formula=['"5,0"'], fill=solid("C6EFCE"))  # Pass
+        )
+        timer.stop()
+
+        # both sheets are written out on save
+        timer = Metrics.start("excel_write")
+        wb.save(output_path)
+        if images_to_embed:
+            ExcelUtils.dedupe_media(output_path)
+        timer.stop()
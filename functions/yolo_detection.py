@@ -1,14 +1,149 @@
+import logging
 from pathlib import Path
 from uuid import uuid4
+from typing import Callable, List, Optional, Tuple
 import cv2
-from ultralytics import YOLO
+import numpy as np
 
-# Load YOLO model once
-model = YOLO("C:/Users/91965/SSST/automatic_exam_grading_system/weights/best.pt")
+from functions.config import (YOLO_BATCH_SIZE, IN_MEMORY_PIPELINE, DEBUG_ARTIFACTS, DETECT_MIN_CONF, DETECT_CONF,
+                              DETECT_CLASS_CONF, DETECT_IOU, DETECT_AGNOSTIC_NMS, DETECT_MAX_DET, OCR_LABELS,
+                              DETECT_SCALE, RENDER_SCALE)
+from functions.metrics_utils import Metrics
+from functions.model_registry import ModelRegistry
+from functions.preprocess_utils import PagePreprocessor
 
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+# Labels whose raw crops are embedded in the result spreadsheets (must exist on disk)
+EXCEL_EMBED_LABELS = {"question_num", "grades"}
+
+# Re-renders a detected box (pixels of the detection image) at OCR resolution:
+# box -> (crop as BGR array, box in OCR-resolution pixels)
+RegionRenderer = Callable[[Tuple[int, int, int, int]], Tuple[np.ndarray, List[int]]]
+
+
+def detection_params() -> dict:
+    """Box filtering settings (part of the page cache key)."""
+    return {"min_conf": DETECT_MIN_CONF, "conf": DETECT_CONF, "class_conf": DETECT_CLASS_CONF, "iou": DETECT_IOU,
+            "agnostic_nms": DETECT_AGNOSTIC_NMS, "max_det": DETECT_MAX_DET, "labels": list(OCR_LABELS)}
+
+
+def _predict_kwargs(names: dict) -> dict:
+    # confidence floor, NMS settings and the classes to keep, applied inside predict()
+    kwargs = {"conf": DETECT_MIN_CONF, "iou": DETECT_IOU, "agnostic_nms": DETECT_AGNOSTIC_NMS, "max_det": DETECT_MAX_DET}
+    if OCR_LABELS:
+        classes = [int(i) for i, name in names.items() if name in OCR_LABELS]
+        if classes:
+            kwargs["classes"] = classes
+        else:
+            # classes=[] would drop every box: keep them all (_collect_detections still filters by label)
+            logging.getLogger(__name__).warning(
+                "None of EXAM_OCR_LABELS %s is a class of the detector (%s)", list(OCR_LABELS), sorted(names.values()))
+    return kwargs
+
+
+def _imwrite(path: Path, img: np.ndarray):
+    with Metrics.stage("jpeg_save", items=1):
+        cv2.imwrite(str(path), img)
+
+
+def _collect_detections(img, result, names: dict, image_path: Optional[Path], output_dir: Path,
+                        save_original: bool = True, in_memory: bool = False,
+                        region: Optional[RegionRenderer] = None) -> dict:
+    """
+    Turn one YOLO result into the per-page structure consumed by ocr.process_and_ocr_image:
+    writes raw + preprocessed crops and detected.jpg into output_dir. Draws boxes on img in place.
+    in_memory: the preprocessed crop is handed over as array ("image") and only the files that are
+    used later (raw crops embedded in Excel, detected.jpg) are written, unless DEBUG_ARTIFACTS is set.
+    region: img is a low resolution render used for detection only; each box is re-rendered at OCR
+    resolution by region() and the crop bbox is given in OCR-resolution pixels.
+    Boxes of labels outside EXAM_OCR_LABELS are ignored; boxes below their label's confidence
+    threshold are neither written nor OCRed, only listed in "low_confidence" ({label, conf, bbox}).
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    keep_on_disk = not in_memory or DEBUG_ARTIFACTS
+
+    cropped_folder = output_dir / "crops"
+    cropped_folder.mkdir(parents=True, exist_ok=True)
+
+    detected_path = output_dir / "detected.jpg"
+    cropped_image_paths = []
+    low_confidence = []
+
+    if result is not None and result.boxes is not None:
+        page_pre = None
+        if region is None and len(result.boxes):
+            with Metrics.stage("crop_preprocess"):
+                page_pre = PagePreprocessor(img)
+        for i, (box, cls_id, conf) in enumerate(zip(result.boxes.xyxy, result.boxes.cls, result.boxes.conf)):
+            x1, y1, x2, y2 = map(int, box[:4])
+            class_name = names[int(cls_id.item())]
+            if OCR_LABELS and class_name not in OCR_LABELS:
+                continue
+            conf = float(conf)
+            if conf < DETECT_CLASS_CONF.get(class_name, DETECT_CONF):
+                # bbox in OCR-resolution pixels, like the crops' bbox
+                bbox = [x1, y1, x2, y2]
+                if region is not None:
+                    bbox = [round(v * RENDER_SCALE / DETECT_SCALE) for v in bbox]
+                low_confidence.append({"label": class_name, "conf": round(conf, 3), "bbox": bbox})
+                continue
+
+            if region is not None:
+                crop_img, bbox = region((x1, y1, x2, y2))
+            else:
+                crop_img, bbox = img[y1:y2, x1:x2], [x1, y1, x2, y2]
+
+            # Save RAW crop (for Excel embedding)
+            raw_crop_path = None
+            if keep_on_disk or class_name in EXCEL_EMBED_LABELS:
+                raw_crop_path = cropped_folder / f"{i}_{class_name}_raw.jpg"
+                _imwrite(raw_crop_path, crop_img)
+
+            # Preprocess for OCR (slice of the binarized page; a re-rendered region is its own page)
+            with Metrics.stage("crop_preprocess", items=1):
+                if region is not None:
+                    th = PagePreprocessor(crop_img).crop((0, 0, crop_img.shape[1], crop_img.shape[0]), class_name)
+                else:
+                    th = page_pre.crop((x1, y1, x2, y2), class_name)
+
+            # Save PREPROCESSED crop
+            crop_path = None
+            if keep_on_disk:
+                crop_path = cropped_folder / f"{i}_{class_name}.jpg"
+                _imwrite(crop_path, th)
+
+            crop_entry = {
+                "label": class_name,
+                "path": str(crop_path) if crop_path else None,            # preprocessed (OCR)
+                "raw_path": str(raw_crop_path) if raw_crop_path else None, # raw (Excel embedding)
+                "bbox": bbox
+            }
+            if in_memory:
+                crop_entry["image"] = th  # gray replicated on 3 channels -> same in BGR and RGB (may be a view of the page)
+            cropped_image_paths.append(crop_entry)
+
+            # Draw bounding boxes
+            cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+        _imwrite(detected_path, img)
+    else:
+        detected_path = None
+        if not keep_on_disk:
+            # no YOLO output: the page image is still needed as fallback for the annotated PDFs
+            image_path = output_dir / "page.jpg"
+            _imwrite(image_path, img)
+
+    return {
+        "original": str(image_path) if (save_original and image_path) else None,
+        "detected_image": str(detected_path) if detected_path else None,
+        "cropped_folder": str(cropped_folder),
+        "cropped_images": cropped_image_paths,
+        "low_confidence": low_confidence,
+    }
+
+
 def process_image_with_yolo(file_path: str, output_dir: Path = None, save_original: bool = True) -> dict:
     try:
         image_path = Path(file_path)
@@ -22,64 +157,51 @@ def process_image_with_yolo(file_path: str, output_dir: Path = None, save_origin
         if output_dir is None:
             unique_id = uuid4().hex
             output_dir = Path("outputs") / unique_id
-        output_dir.mkdir(parents=True, exist_ok=True)
-
-        cropped_folder = output_dir / "crops"
-        cropped_folder.mkdir(parents=True, exist_ok=True)
-
-        detected_path = output_dir / "detected.jpg"
 
-        results = model.predict(img)
-        cropped_image_paths = []
-
-        if results and results[0].boxes is not None:
-            for i, (box, cls_id) in enumerate(zip(results[0].boxes.xyxy, results[0].boxes.cls)):
-                x1, y1, x2, y2 = map(int, box[:4])
-                crop_img = img[y1:y2, x1:x2]
-
-                # Save RAW crop (for Excel embedding)
-                class_name = model.names[int(cls_id.item())]
-                raw_crop_path = cropped_folder / f"{i}_{class_name}_raw.jpg"
-                cv2.imwrite(str(raw_crop_path), crop_img)
-
-                # Preprocess for OCR
-                gray = cv2.cvtColor(crop_img, cv2.COLOR_BGR2GRAY)
-                gray = cv2.GaussianBlur(gray, (3, 3), 0)
-                th = cv2.adaptiveThreshold(
-                    gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 15, 11
-                )
-                h, w = th.shape[:2]
-                if max(h, w) < 200:
-                    th = cv2.resize(th, (w * 2, h * 2), interpolation=cv2.INTER_CUBIC)
-                th = cv2.cvtColor(th, cv2.COLOR_GRAY2BGR)
-
-                # Save PREPROCESSED crop
-                crop_path = cropped_folder / f"{i}_{class_name}.jpg"
-                cv2.imwrite(str(crop_path), th)
-
-                cropped_image_paths.append({
-                    "label": class_name,
-                    "path": str(crop_path),        # preprocessed (OCR)
-                    "raw_path": str(raw_crop_path), # raw (Excel embedding)
-                    "bbox": [x1, y1, x2, y2]
-                })
-
-                # Draw bounding boxes
-                cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-            cv2.imwrite(str(detected_path), img)
-        else:
-            detected_path = None
-
-        return {
-            "original": str(image_path) if save_original else None,
-            "detected_image": str(detected_path) if detected_path else None,
-            "cropped_folder": str(cropped_folder),
-            "cropped_images": cropped_image_paths
-        }
+        model = ModelRegistry.get_detector()
+        with Metrics.stage("model_predict", items=1):
+            results = model.predict(img, **_predict_kwargs(model.names))
+        return _collect_detections(img, results[0] if results else None, model.names, image_path, output_dir, save_original)
 
     except Exception as e:
         raise RuntimeError(f"Image processing failed: {str(e)}")
 
 
+def process_images_with_yolo_batch(images: List[np.ndarray], output_dirs: List[Path],
+                                   image_paths: Optional[List[Optional[str]]] = None,
+                                   batch_size: int = YOLO_BATCH_SIZE,
+                                   in_memory: bool = IN_MEMORY_PIPELINE,
+                                   regions: Optional[List[Optional[RegionRenderer]]] = None) -> List[dict]:
+    """
+    Batched variant of process_image_with_yolo for already rendered pages (BGR arrays).
+    Runs one model.predict call per batch_size pages and returns one dict per page
+    (same structure as process_image_with_yolo), in input order.
+    in_memory: crops are passed on as arrays, see _collect_detections.
+    regions: per page, the region renderer of a two-resolution render (see _collect_detections).
+    """
+    if len(images) != len(output_dirs):
+        raise ValueError("images and output_dirs must have the same length")
+    if image_paths is None:
+        image_paths = [None] * len(images)
+    if regions is None:
+        regions = [None] * len(images)
 
+    try:
+        model = ModelRegistry.get_detector()
+        page_results: List[dict] = []
+        predict_kwargs = _predict_kwargs(model.names)
+        step = max(1, batch_size)
+        for start in range(0, len(images), step):
+            batch = images[start:start + step]
+            with Metrics.stage("model_predict", items=len(batch)):
+                results = model.predict(batch, **predict_kwargs)
+            for offset, img in enumerate(batch):
+                idx = start + offset
+                res = results[offset] if results and offset < len(results) else None
+                path = Path(image_paths[idx]) if image_paths[idx] else None
+                page_results.append(_collect_detections(img, res, model.names, path, Path(output_dirs[idx]),
+                                                         in_memory=in_memory, region=regions[idx]))
+        return page_results
+
+    except Exception as e:
+        raise RuntimeError(f"Batch image processing failed: {str(e)}")
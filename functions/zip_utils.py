@@ -0,0 +1,250 @@
+import hashlib
+import os
+import struct
+import time
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from functions.metrics_utils import Metrics
+
+# Already compressed formats are stored as they are (deflating them again costs CPU for nothing)
+STORED_SUFFIXES = {".pdf", ".xlsx", ".docx", ".png", ".jpg", ".jpeg", ".zip", ".gz"}
+CHUNK_SIZE = 1 << 20
+
+_ZIP64_LIMIT = 0xFFFFFFFF
+_STORED, _DEFLATED = 0, 8
+_FLAG_UTF8, _FLAG_DESCRIPTOR = 0x0800, 0x0008
+
+
+@lru_cache(maxsize=4096)
+def _file_crc(path: str, size: int, mtime_ns: int) -> int:
+    # size/mtime are part of the key so a rewritten file is checksummed again
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _dos_datetime(mtime: float) -> Tuple[int, int]:
+    t = time.localtime(max(mtime, 315532800))  # ZIP timestamps start in 1980
+    return (t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2,
+            (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday)
+
+
+class ZipUtils:
+    """
+    ZIP archives produced as a byte stream (no temporary archive on disk).
+    Members are (arcname, path) pairs. Members in STORED_SUFFIXES are stored, the rest deflated.
+    When every member is stored, the archive length and the position of every byte are known
+    up front, so any byte range can be produced on its own (HTTP range requests / resume).
+    ZIP64 records are used when the archive can exceed 4 GiB or 65535 members.
+    """
+
+    def members_from_folder(folder: Path, prefix: str = "") -> List[Tuple[str, Path]]:
+        members = []
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            for f in sorted(files):
+                file_path = Path(root) / f
+                members.append((prefix + file_path.relative_to(folder).as_posix(), file_path))
+        return members
+
+    def _entries(members: List[Tuple[str, Path]]) -> List[Dict[str, Any]]:
+        entries = []
+        for arcname, path in members:
+            st = os.stat(path)
+            dostime, dosdate = _dos_datetime(st.st_mtime)
+            stored = Path(path).suffix.lower() in STORED_SUFFIXES
+            entries.append({
+                "name": arcname.encode("utf-8"),
+                "path": str(path),
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "method": _STORED if stored else _DEFLATED,
+                "dostime": dostime,
+                "dosdate": dosdate,
+                # known up front for stored members, filled in while streaming for deflated ones
+                "crc": None,
+                "comp_size": st.st_size if stored else None,
+                "offset": None,
+            })
+        return entries
+
+    def _needs_zip64(entries: List[Dict[str, Any]]) -> bool:
+        # deflate can grow incompressible data slightly; headers are generously included
+        worst = sum(e["size"] + e["size"] // 1000 + 2 * len(e["name"]) + 256 for e in entries)
+        return len(entries) >= 0xFFFF or worst >= _ZIP64_LIMIT
+
+    def content_length(members: List[Tuple[str, Path]]) -> Optional[int]:
+        """Archive size in bytes, or None when it is only known after deflating (some member not stored)."""
+        entries = ZipUtils._entries(members)
+        if any(e["method"] != _STORED for e in entries):
+            return None
+        return sum(length for _, _, length, _ in ZipUtils._pieces(entries, ZipUtils._needs_zip64(entries)))
+
+    def etag(members: List[Tuple[str, Path]]) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        for e in ZipUtils._entries(members):
+            h.update(b"%s|%d|%d\n" % (e["name"], e["size"], e["mtime_ns"]))
+        return h.hexdigest()
+
+    def stream(members: List[Tuple[str, Path]], start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Bytes [start, stop) of the archive. start > 0 is only possible when content_length is known.
+        Stored members are read straight from their files (seeking past skipped bytes).
+        Recorded as "zip" stage: the time spent producing the chunks (not waiting for the consumer).
+        """
+        chunks = ZipUtils._stream(members, start, stop)
+        wall = cpu = 0.0
+        size = 0
+        try:
+            while True:
+                t0, c0 = time.perf_counter(), time.thread_time()
+                chunk = next(chunks, None)
+                wall += time.perf_counter() - t0
+                cpu += time.thread_time() - c0
+                if chunk is None:
+                    return
+                size += len(chunk)
+                yield chunk
+        finally:
+            chunks.close()
+            Metrics.record("zip", wall, cpu, size)
+
+    def _stream(members: List[Tuple[str, Path]], start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+        entries = ZipUtils._entries(members)
+        zip64 = ZipUtils._needs_zip64(entries)
+        if start and any(e["method"] != _STORED for e in entries):
+            raise ValueError("Byte ranges need an archive with stored members only")
+
+        pos = 0
+        for kind, entry, length, produce in ZipUtils._pieces(entries, zip64):
+            if kind in ("local", "central"):
+                entry["offset"] = pos
+            if stop is not None and pos >= stop:
+                return
+            if length is not None and pos + length <= start:
+                pos += length
+                continue
+            skip = max(0, start - pos)
+            pos += skip
+            for chunk in produce(skip):
+                if stop is not None and pos + len(chunk) > stop:
+                    chunk = chunk[:stop - pos]
+                if chunk:
+                    yield chunk
+                pos += len(chunk)
+                if stop is not None and pos >= stop:
+                    return
+
+    def write(members: List[Tuple[str, Path]], zip_path: Path) -> str:
+        zip_path = Path(zip_path)
+        tmp = zip_path.with_name(zip_path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            for chunk in ZipUtils.stream(members):
+                f.write(chunk)
+        tmp.replace(zip_path)
+        return str(zip_path)
+
+    # --------------------------
+    # archive layout
+    # --------------------------
+    def _pieces(entries: List[Dict[str, Any]], zip64: bool) -> Iterator[Tuple[str, Dict[str, Any], Optional[int], Callable[[int], Iterator[bytes]]]]:
+        """
+        The archive as consecutive pieces (kind, entry, length or None, produce(skip) -> chunks).
+        Offsets are assigned by the consumer in order, so the central directory comes last.
+        """
+        def constant(build: Callable[[], bytes]) -> Callable[[int], Iterator[bytes]]:
+            def produce(skip: int) -> Iterator[bytes]:
+                yield build()[skip:]
+            return produce
+
+        for e in entries:
+            local_len = 30 + len(e["name"]) + (20 if zip64 else 0)
+            yield "local", e, local_len, constant(lambda e=e: ZipUtils._local_header(e, zip64))
+            if e["method"] == _STORED:
+                yield "data", e, e["size"], lambda skip, e=e: ZipUtils._read_stored(e, skip)
+            else:
+                yield "data", e, None, lambda skip, e=e: ZipUtils._deflate(e)
+                yield "descriptor", e, 24 if zip64 else 16, constant(lambda e=e: ZipUtils._descriptor(e, zip64))
+
+        directory = {"offset": None}
+        cd_len = sum(46 + len(e["name"]) + (28 if zip64 else 0) for e in entries)
+        end_len = (56 + 20 if zip64 else 0) + 22
+        yield "central", directory, cd_len + end_len, constant(
+            lambda: ZipUtils._central_directory(entries, directory["offset"], zip64))
+
+    def _crc(e: Dict[str, Any]) -> int:
+        if e["crc"] is None:
+            e["crc"] = _file_crc(e["path"], e["size"], e["mtime_ns"])
+        return e["crc"]
+
+    def _local_header(e: Dict[str, Any], zip64: bool) -> bytes:
+        if e["method"] == _STORED:
+            flags, crc, comp, size = _FLAG_UTF8, ZipUtils._crc(e), e["size"], e["size"]
+        else:
+            # sizes and crc follow the data in a data descriptor
+            flags, crc, comp, size = _FLAG_UTF8 | _FLAG_DESCRIPTOR, 0, 0, 0
+        extra = b""
+        if zip64:
+            extra = struct.pack("<HHQQ", 0x0001, 16, size, comp)
+            comp = size = _ZIP64_LIMIT if e["method"] == _STORED else 0
+        return struct.pack("<IHHHHHIIIHH", 0x04034B50, 45 if zip64 else 20, flags, e["method"],
+                           e["dostime"], e["dosdate"], crc, comp, size, len(e["name"]), len(extra)) + e["name"] + extra
+
+    def _read_stored(e: Dict[str, Any], skip: int) -> Iterator[bytes]:
+        remaining = e["size"] - skip
+        with open(e["path"], "rb") as f:
+            f.seek(skip)
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise IOError(f"{e['path']} changed while it was being zipped")
+                remaining -= len(chunk)
+                yield chunk
+
+    def _deflate(e: Dict[str, Any]) -> Iterator[bytes]:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        crc, comp = 0, 0
+        with open(e["path"], "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                crc = zlib.crc32(chunk, crc)
+                out = compressor.compress(chunk)
+                comp += len(out)
+                if out:
+                    yield out
+        out = compressor.flush()
+        comp += len(out)
+        e["crc"], e["comp_size"] = crc, comp
+        yield out
+
+    def _descriptor(e: Dict[str, Any], zip64: bool) -> bytes:
+        fmt = "<IIQQ" if zip64 else "<IIII"
+        return struct.pack(fmt, 0x08074B50, e["crc"], e["comp_size"], e["size"])
+
+    def _central_directory(entries: List[Dict[str, Any]], cd_offset: int, zip64: bool) -> bytes:
+        records = []
+        for e in entries:
+            flags = _FLAG_UTF8 | (_FLAG_DESCRIPTOR if e["method"] != _STORED else 0)
+            comp, size, offset = e["comp_size"], e["size"], e["offset"]
+            extra = b""
+            if zip64:
+                extra = struct.pack("<HHQQQ", 0x0001, 24, size, comp, offset)
+                comp = size = offset = _ZIP64_LIMIT
+            records.append(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | (45 if zip64 else 20), 45 if zip64 else 20,
+                flags, e["method"], e["dostime"], e["dosdate"], ZipUtils._crc(e), comp, size,
+                len(e["name"]), len(extra), 0, 0, 0, 0o100644 << 16, offset) + e["name"] + extra)
+        cd = b"".join(records)
+
+        end = b""
+        count = len(entries)
+        if zip64:
+            eocd64_offset = cd_offset + len(cd)
+            end += struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, len(cd), cd_offset)
+            end += struct.pack("<IIQI", 0x07064B50, 0, eocd64_offset, 1)
+            return cd + end + struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, 0xFFFF, 0xFFFF, _ZIP64_LIMIT, _ZIP64_LIMIT, 0)
+        return cd + struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, len(cd), cd_offset, 0)
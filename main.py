@@ -1,16 +1,40 @@
  
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from pathlib import Path
+import logging
 import os
+import threading
 import uvicorn
 from routes.routes_mapping import include_routes
+from functions.config import WARM_UP_ON_STARTUP
+from functions.metrics_utils import Metrics
+from functions.model_registry import ModelRegistry
 
 UPLOAD_DIR = Path("uploads")
 
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-app = FastAPI(title="Exam Evaluation", description="Ease of evaluation", version="1.0.0")
+
+def _warm_up_models():
+    try:
+        ModelRegistry.warm_up()
+    except Exception:
+        # reported through /health, requests will retry the load on first use
+        logging.getLogger(__name__).warning("Model warm-up failed", exc_info=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load the models in the background so startup (and --reload) is not blocked
+    if WARM_UP_ON_STARTUP:
+        threading.Thread(target=_warm_up_models, daemon=True).start()
+    yield
+
+
+app = FastAPI(title="Exam Evaluation", description="Ease of evaluation", version="1.0.0", lifespan=lifespan)
 
 include_routes(app)
 
@@ -18,6 +42,16 @@ include_routes(app)
 async def root():
     return {"message": "Welcome to the ThinkCompanion, Your Intelligent Documemt Ally!"}
 
+@app.get("/health")
+async def health():
+    """Liveness + model readiness (detector / recognizer loaded)."""
+    return ModelRegistry.status()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage wall/CPU time, item counts and memory since startup (Prometheus text format)."""
+    return PlainTextResponse(Metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
 # Run the application with Uvicorn
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,214 +1,236 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
 from pathlib import Path
-import shutil
-import pypdfium2 as pdfium
+import asyncio
+import json
 from uuid import uuid4
-import pandas as pd
-import os
-from typing import List, Dict, Tuple, Any, Optional
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
-from openpyxl.chart import BarChart, Reference  # kept in case you re-enable later
-from PIL import Image
-import zipfile
+from typing import List, Dict, Tuple, Optional
 import re
-import matplotlib
-matplotlib.use("Agg")  # ensure headless
-import matplotlib.pyplot as plt
-
-from functions import ocr  # <-- your YOLO+OCR wrapper
-from functions.chart_utils import ChartUtils
-from functions.excel_utils import ExcelUtils
-from functions.grade_utils import GradeUtils
-from functions.matnum_utils import MatNumUtils
-from functions.ocr_post_utils import OCRPostUtils
-from functions.page_utils import PageUtils
-from functions.pdf_utils import PdfUtils
-from functions.question_utils import QuestionUtils
-from functions.student_utils import StudentUtils
+
+from functions.config import JOB_WORKERS
+from functions.job_utils import JobManager
+from functions.metrics_utils import JobMetrics, Metrics
+from functions.pipeline_utils import PipelineUtils
+from functions.zip_utils import ZipUtils
 
 router = APIRouter()
 OUTPUT_DIR = Path("processed_results")
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-
-# --------------------------
-# Configurable grading table (generic)
-# --------------------------
-DEFAULT_GRADING_TABLE = [
-    (0,  "5,0"),
-    (50, "4,0"),
-    (55, "3,7"),
-    (60, "3,3"),
-    (65, "3,0"),
-    (70, "2,7"),
-    (75, "2,3"),
-    (80, "2,0"),
-    (85, "1,7"),
-    (90, "1,3"),
-    (95, "1,0"),
-]
-
-# Colors (hex without alpha for openpyxl)
-COLORS = {
-    "full":        "C6EFCE",  # light green
-    "zero":        "C00000",  # deep red (changed from FFC7CE)
-    "no_match":    "EE82EE",  # violet
-    "double_match":"800080",  # purple
-    "invalid":     "FFA07A",  # orange-like for invalid/plausibility
-    "normalized":  "FFA500",  # orange for normalized (distinct)
-    "page_error":  "D3D3D3"   # light gray for page plausibility error
-}
-
-# Font color overrides for readability
-FONT_COLORS = {
-    "double_match": "FFFFFF",  # white on purple
-    "zero": "FFFFFF"  # white on deep red
-}
-
-
-@router.post("/process-image/")
+# Bounded pool running the vision/Excel pipeline off the event loop
+job_manager = JobManager(max_workers=JOB_WORKERS)
+
+# Uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Job event stream: how often the event log is checked, and the keep-alive comment period (seconds)
+EVENTS_POLL_INTERVAL = 0.25
+EVENTS_KEEPALIVE = 15
+
+
+def _job_folder(job_id: str) -> Path:
+    # job ids are uuid4 hex strings; anything else never maps to a folder
+    if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return OUTPUT_DIR / job_id
+
+
+def _parse_range(range_header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    """
+    Single "bytes=" range -> (start, stop) with stop exclusive; None means the whole body
+    (no header, an invalid range such as "bytes=200-100", or several ranges, which are answered
+    with the full archive).
+    """
+    if not range_header:
+        return None
+    m = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", range_header)
+    if m is None:
+        return None
+    first, last = m.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            # syntactically invalid (RFC 9110): ignored, not unsatisfiable
+            return None
+        stop = min(int(last) + 1, total) if last else total
+    elif last:
+        # suffix range: the last N bytes
+        start, stop = max(total - int(last), 0), total
+    else:
+        return None
+    if start >= total or start >= stop:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{total}"})
+    return start, stop
+
+
+@router.post("/process-image/", status_code=202)
 async def process_image_from_upload(file: UploadFile = File(...)):
+    """
+    Save the upload and queue it on the job pool; returns the job id immediately.
+    Poll GET /processing/jobs/{job_id} and fetch GET /processing/jobs/{job_id}/result.
+    """
     try:
         unique_id = uuid4().hex
         pdf_folder = OUTPUT_DIR / unique_id
         pdf_folder.mkdir(parents=True, exist_ok=True)
 
         saved_pdf_path = pdf_folder / file.filename
-        with open(saved_pdf_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Convert PDF to images and run YOLO+OCR per page
-        pdf = pdfium.PdfDocument(str(saved_pdf_path))
-        pages_results: List[Dict[str, Any]] = []
-
-        for i in range(len(pdf)):
-            page_num = i + 1
-            page_folder = pdf_folder / f"image_{page_num}"
-            page_folder.mkdir(parents=True, exist_ok=True)
-
-            page = pdf[i]
-            pil_image = page.render(scale=4).to_pil()
-            page_image_path = page_folder / "page.jpg"
-            pil_image.save(page_image_path)
-
-            # call your YOLO+OCR wrapper - should return dict with "results" list
-            result = ocr.process_and_ocr_image(str(page_image_path), output_dir=page_folder)
-            result.update({"page": page_num, "page_folder": str(page_folder)})
-            pages_results.append(result)
-
-        # Split pages into students by Mat_num
-        student_groups = MatNumUtils.split_pages_by_matnum(pages_results)
-
-        students_rows: List[Dict[str, Any]] = []
-        students_norm_flags: List[Dict[str, bool]] = []
-        students_numeric: List[Dict[str, Optional[float]]] = []
-        students_qmaps: List[Dict[str, Any]] = []
-        students_seen: List[Dict[str, int]] = []
-        students_issues: List[Dict[str, Any]] = []
-        per_student_folders: List[Path] = []
-
-        # process each student group
-        for idx, pages in enumerate(student_groups):
-            student_folder = pdf_folder / f"student_{idx+1}"
-            student_folder.mkdir(parents=True, exist_ok=True)
-
-            student_info, qmap, per_q_seen, page_markers = StudentUtils.extract_from_pages(pages)
-            page_check_msg, page_ok = PageUtils.page_plausibility_check(page_markers, pages)
-
-            # build student row
-            row, norm_flags, numeric_achieved = StudentUtils.build_student_row_and_flags(student_info, qmap, pdf_folder, page_check_msg)
-            # compute and attach totals/percent/mark already done in build_student_row_and_flags
-
-            issues, per_q_status = QuestionUtils.run_plausibility_checks(qmap, numeric_achieved, per_q_seen)
-            # append page-related plausibility issue to issues
-            if not page_ok:
-                issues.append(f"Page check: {page_check_msg}")
-
-            # collect
-            students_rows.append(row)
-            students_norm_flags.append(norm_flags)
-            students_numeric.append(numeric_achieved)
-            students_qmaps.append(qmap)
-            students_seen.append(per_q_seen)
-            students_issues.append({"issues": issues, "per_q_status": per_q_status, "page_check": page_check_msg})
-
-            # create per-student annotated PDF (detected.jpg pages for this group)
-            imgs = []
-            for p in pages:
-                pf_path = Path(p.get("page_folder"))
-                det = pf_path / "detected.jpg"
-                if det.exists():
-                    imgs.append(Image.open(det).convert("RGB"))
-            if imgs:
-                student_pdf_path = student_folder / "annotated_student.pdf"
-                imgs[0].save(student_pdf_path, save_all=True, append_images=imgs[1:])
-            else:
-                # fallback: create PDF from page.jpg
-                fallback_imgs = []
-                for p in pages:
-                    pf_path = Path(p.get("page_folder"))
-                    pj = pf_path / "page.jpg"
-                    if pj.exists():
-                        fallback_imgs.append(Image.open(pj).convert("RGB"))
-                if fallback_imgs:
-                    fallback_path = student_folder / "annotated_student.pdf"
-                    fallback_imgs[0].save(fallback_path, save_all=True, append_images=fallback_imgs[1:])
-
-            # create per-student excel (with primus sheet included) - NO charts inside
-            per_excel = student_folder / "student_result.xlsx"
-            StudentUtils.save_students_excel_and_primus([row], [norm_flags], [numeric_achieved], [qmap], [per_q_seen], per_excel,unique_id)
-
-            per_student_folders.append(student_folder)
-
-        # also produce a merged annotated PDF (all pages) and a combined Excel for all students
-        merged_pdf = PdfUtils.save_annotated_pdf(pdf_folder, out_name="annotated_all.pdf")
-        combined_excel = pdf_folder / "all_students_results.xlsx"
-        StudentUtils.save_students_excel_and_primus(students_rows, students_norm_flags, students_numeric, students_qmaps, students_seen, combined_excel,unique_id)
-
-        # if multiple students -> bundle into one ZIP and include ONLY the overall grade chart inside the ZIP
-        bundle_path: Optional[str] = None
-        if len(per_student_folders) > 1:
-            # create grade distribution chart
-            chart_path = pdf_folder / "grade_distribution.png"
-            chart_file = ChartUtils.generate_grade_distribution_chart(students_rows, chart_path)
-
-            zip_path = pdf_folder / "batch_results.zip"
-            with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-                # add per-student folders
-                for sf in per_student_folders:
-                    for root, _, files in os.walk(sf):
-                        for f in files:
-                            fp = Path(root) / f
-                            arc = fp.relative_to(pdf_folder)
-                            zf.write(fp, arc)
-                # add the overall chart at root of zip (only if created)
-                if chart_file and Path(chart_file).exists():
-                    zf.write(chart_file, Path(chart_file).name)
-            bundle_path = str(zip_path)
-
-        response = {
-            "message": "✅ Processing complete",
-            "output_dir": str(pdf_folder),
-            "combined_excel": str(combined_excel),
-            "annotated_all_pdf": merged_pdf,
-            "zip_if_batch": bundle_path,
-            "students_count": len(students_rows),
-            "students_issues": students_issues
+        # chunked async copy: the event loop keeps serving other requests meanwhile
+        metrics = JobMetrics()
+        with Metrics.job(metrics), Metrics.stage("pdf_save") as timer:
+            with open(saved_pdf_path, "wb") as buffer:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    buffer.write(chunk)
+                    timer.items += len(chunk)
+
+        job_manager.submit(unique_id, PipelineUtils.run_pipeline, saved_pdf_path, pdf_folder, unique_id, metrics=metrics)
+
+        return {
+            "message": "⏳ Processing queued",
+            "job_id": unique_id,
+            "status_url": f"/processing/jobs/{unique_id}",
+            "events_url": f"/processing/jobs/{unique_id}/events",
+            "result_url": f"/processing/jobs/{unique_id}/result",
         }
-        return response
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to process PDF: {str(e)}")
-
-
-
-
-
-
-
-
-
-
-
-
+        raise HTTPException(status_code=500, detail=f"Failed to queue PDF: {str(e)}")
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request, since: int = 0):
+    """
+    Server-sent events of a job as they happen: progress, page_rendered, page_detected, page_ocr,
+    student_finalized and export_written (each with timings), closed by a "status" event (done/failed).
+    Every event carries its sequence number as SSE id; reconnecting clients resume after
+    Last-Event-ID (or ?since=<seq>). A job dropped from memory meanwhile (EXAM_JOB_TTL) closes the
+    stream with a "gone" event.
+    """
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    last_event_id = request.headers.get("last-event-id")
+    start = int(last_event_id) if last_event_id and last_event_id.isdigit() else since
+
+    async def event_stream():
+        seq, idle = start, 0.0
+        while True:
+            events = job_manager.events_since(job_id, seq)
+            if events is None or (not events and job_manager.get(job_id) is None):
+                # pruned while followed: no status event will ever come
+                gone = {"job_id": job_id, "detail": f"Unknown job: {job_id}"}
+                yield f"event: gone\ndata: {json.dumps(gone)}\n\n"
+                return
+            for event in events:
+                seq = event["seq"]
+                yield f"id: {seq}\nevent: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+                if event["event"] == "status":
+                    return
+            if events:
+                idle = 0.0
+                continue
+            if await request.is_disconnected():
+                return
+            idle += EVENTS_POLL_INTERVAL
+            if idle >= EVENTS_KEEPALIVE:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Failed to process PDF: {job['error']}")
+    if job["status"] != "done":
+        # not finished yet -> 202 with the current status
+        return JSONResponse(status_code=202, content=job)
+    return job_manager.result(job_id)
+
+
+class RegradeRequest(BaseModel):
+    # [[min_percent, mark], ...] ascending, like grade_utils.DEFAULT_GRADING_TABLE; None keeps the table
+    # of the last regrade that passed one (DEFAULT_GRADING_TABLE if none did)
+    grading_table: Optional[List[Tuple[float, str]]] = None
+    # {student_number (1-based): {question_number: raw grade or null}}
+    corrections: Optional[Dict[str, Dict[str, Optional[str]]]] = None
+
+
+@router.post("/jobs/{job_id}/regrade")
+async def regrade_job(job_id: str, request: Optional[RegradeRequest] = None):
+    """
+    Recompute marks and the Excel/Primus exports of a finished job from its stored
+    grading state (no rendering / YOLO / OCR), optionally with manual grade corrections.
+    """
+    job = job_manager.get(job_id)
+    if job is not None and job["status"] not in ("done", "failed"):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is still {job['status']}")
+
+    pdf_folder = _job_folder(job_id)
+    request = request or RegradeRequest()
+    try:
+        return await run_in_threadpool(
+            PipelineUtils.regrade, pdf_folder, job_id, request.grading_table, request.corrections
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"No grading state for job: {job_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to regrade: {str(e)}")
+
+
+@router.get("/jobs/{job_id}/bundle")
+async def download_bundle(job_id: str, request: Request):
+    """
+    ZIP bundle of a finished batch (per-student folders + grade chart), streamed while it is built.
+    PDFs, workbooks and images are stored without recompression, which makes the archive size known
+    up front: the response then supports Range / If-Range requests to resume downloads.
+    """
+    pdf_folder = _job_folder(job_id)
+    job = job_manager.get(job_id)
+    if job is not None and job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']}")
+
+    members = PipelineUtils.bundle_members(pdf_folder)
+    if not members:
+        raise HTTPException(status_code=404, detail=f"No batch bundle for job: {job_id}")
+
+    etag = f'"{ZipUtils.etag(members)}"'
+    headers = {
+        "Content-Disposition": f'attachment; filename="batch_results_{job_id}.zip"',
+        "ETag": etag,
+    }
+    total = ZipUtils.content_length(members)
+    if total is None:
+        # some member is deflated on the fly: length unknown, no ranges
+        return StreamingResponse(ZipUtils.stream(members), media_type="application/zip", headers=headers)
+
+    headers["Accept-Ranges"] = "bytes"
+    if_range = request.headers.get("if-range")
+    byte_range = _parse_range(request.headers.get("range"), total) if if_range in (None, etag) else None
+    if byte_range is None:
+        headers["Content-Length"] = str(total)
+        return StreamingResponse(ZipUtils.stream(members), media_type="application/zip", headers=headers)
+
+    start, stop = byte_range
+    headers["Content-Range"] = f"bytes {start}-{stop - 1}/{total}"
+    headers["Content-Length"] = str(stop - start)
+    return StreamingResponse(ZipUtils.stream(members, start, stop), status_code=206,
+                             media_type="application/zip", headers=headers)